@@ -1,41 +1,117 @@
-from src.clustering.clustering_utils import find_euclidean_distance, find_cosine_similarity
-from dlib import chinese_whispers_clustering
-import dlib
+from src.clustering.clustering_utils import find_euclidean_distance, find_cosine_similarity, squared_norms, \
+    get_distance_name, BLOCK_DISTANCES, DISTANCE_NAMES
+from src.clustering.nearest_neighbors import find_nearest_neighbors
+from scipy.sparse import csr_matrix
+import numpy as np
+
+THRESHOLD_BLOCK_SIZE = 256
 
 
 def cluster_threshold(vectors, params_dict):
     if params_dict is None:
         params_dict = {"threshold": 0.15, "distance": find_euclidean_distance}
 
-    labels = []
-    clusters = {}
     threshold = params_dict["threshold"]
     distance_func = params_dict["distance"]
+
+    vectors = np.asarray(vectors, dtype="float64")
+    labels = np.empty(len(vectors), dtype=int)
     latest_cluster = 0
 
-    for vector in vectors:
-        added = False
-        for cluster in clusters.keys():
-            for labeled in clusters[cluster]:
-                if distance_func(vector, labeled) <= threshold:
-                    labels.append(cluster)
-                    clusters[cluster].append(vector)
-                    added = True
-                    break
-
-            if added:
-                break
-        else:
-            clusters.update({latest_cluster: [vector]})
-            labels.append(latest_cluster)
-            latest_cluster += 1
+    for start, end, block in preceding_distances(vectors, distance_func):
+        for i in range(start, end):
+            # Every preceding vector is a member of some cluster, and clusters are checked in creation order,
+            # so the first matching cluster is the one with the smallest label among the close enough members
+            matched = labels[:i][block[i - start, :i] <= threshold]
+
+            if len(matched) > 0:
+                labels[i] = matched.min()
+            else:
+                labels[i] = latest_cluster
+                latest_cluster += 1
 
     return labels
 
 
-def chinese_whispers(encodings, params_dict):
+def preceding_distances(vectors, distance_func, block_size=THRESHOLD_BLOCK_SIZE):
+    if not callable(distance_func) or distance_func in DISTANCE_NAMES:
+        distance_block = BLOCK_DISTANCES[get_distance_name(distance_func)]
+        vectors_squared_norms = squared_norms(vectors)
+
+        for start in range(0, len(vectors), block_size):
+            end = min(start + block_size, len(vectors))
+
+            yield start, end, distance_block(vectors[start:end], vectors[:end], vectors_squared_norms[:end])
+    else:
+        for i in range(len(vectors)):
+            yield i, i + 1, np.atleast_2d(distance_func(vectors[i], vectors[:i]))
+
+
+def chinese_whispers(vectors, params_dict):
+    threshold = params_dict["threshold"]
+    n_neighbors = params_dict.get("n_neighbors", 50)
+    iterations = params_dict.get("iterations", 100)
+    batch_size = params_dict.get("batch_size", 256)
+    distance = params_dict.get("distance", "euclidean")
+    index = params_dict.get("index", "exact")
+
+    graph = create_knn_graph(vectors, n_neighbors, threshold, distance, index)
+    random = np.random.RandomState(params_dict.get("random_state", 0))
+    labels = np.arange(len(vectors))
+
+    # Nodes are visited in a random order, and the labels of each batch are updated at once
+    for _ in range(iterations):
+        order = random.permutation(len(vectors))
+        changed = 0
+
+        for start in range(0, len(vectors), batch_size):
+            nodes = order[start:start + batch_size]
+            new_labels = propagate_labels(graph, labels, nodes)
+
+            changed += np.count_nonzero(new_labels != labels[nodes])
+            labels[nodes] = new_labels
+
+        if changed == 0:
+            break
+
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def create_knn_graph(vectors, n_neighbors, threshold, distance="euclidean", index="exact"):
+    neighbors, dists = find_nearest_neighbors(vectors, n_neighbors, index=index, distance=distance)
+
+    close = dists < threshold
+    rows = np.broadcast_to(np.arange(len(vectors))[:, None], neighbors.shape)[close]
+    graph = csr_matrix((np.ones(len(rows), dtype="float32"), (rows, neighbors[close])),
+                       shape=(len(vectors), len(vectors)))
+
+    return graph.maximum(graph.T)
+
+
+def propagate_labels(graph, labels, nodes):
+    edges = graph[nodes].tocoo()
+
+    # Total edge weight of every (node, neighbor label) pair
+    pairs, inverse = np.unique(edges.row.astype("int64") * len(labels) + labels[edges.col], return_inverse=True)
+    weights = np.bincount(inverse, weights=edges.data)
+    rows = pairs // len(labels)
+    candidates = pairs % len(labels)
+
+    # The heaviest label wins, ties go to the smallest label
+    order = np.lexsort((-weights, rows))
+    best = order[np.r_[True, rows[order][1:] != rows[order][:-1]]]
+
+    new_labels = labels[nodes]
+    new_labels[rows[best]] = candidates[best]
+
+    return new_labels
+
+
+def chinese_whispers_dlib(encodings, params_dict):
+    import dlib
+
     encodings = [dlib.vector(vector) for vector in encodings]
     threshold = params_dict["threshold"]
-    labels = chinese_whispers_clustering(encodings, threshold)
+    labels = dlib.chinese_whispers_clustering(encodings, threshold)
 
     return labels
@@ -1,119 +1,141 @@
 # This is an implementation of https://arxiv.org/pdf/1604.00989.pdf, a modified version of rank-order clustering.
 
-import pyflann
 import numpy as np
 from functools import partial
+from multiprocessing import Pool, current_process
+from multiprocessing.shared_memory import SharedMemory
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from src.clustering.nearest_neighbors import find_nearest_neighbors, SparseNeighborLookup
 
 INFINITE = 9999.0
+SYMMETRIC_DIST_BLOCK_ELEMENTS = 2 ** 20
 
 
-def build_index(dataset, n_neighbors, distance="euclidean"):
-    pyflann.set_distance_type(distance_type=distance)
-    flann = pyflann.FLANN()
-    params = flann.build_index(dataset, algorithm='kdtree', trees=4)
+def build_index(dataset, n_neighbors, distance="euclidean", index="flann"):
+    return find_nearest_neighbors(dataset, n_neighbors, index=index, distance=distance)
 
-    nearest_neighbors, dists = flann.nn_index(dataset, n_neighbors, checks=params['checks'])
 
-    return nearest_neighbors, dists
+def calculate_symmetric_dist_rows(app_nearest_neighbors, nn_lookup, start, end):
+    n_neighbors = app_nearest_neighbors.shape[1]
+    rows = app_nearest_neighbors[start:end]
+    faces = np.arange(start, end)[:, None]
+    neighbors = rows[:, 1:]
 
+    # Oi is the position of the neighbor in the face list, Oj is the position of the face in the neighbor list
+    # or the list length if they are not co-neighbors
+    o_i = np.arange(1, n_neighbors)[None, :]
+    o_j = nn_lookup.lookup(neighbors, faces) + 1
+    co_neighbor = o_j <= n_neighbors
 
-def create_neighbor_lookup(nearest_neighbors):
-    nn_lookup = {}
-    for i in range(nearest_neighbors.shape[0]):
-        nn_lookup[i] = nearest_neighbors[i, :]
+    positions = np.arange(n_neighbors)[None, None, :]
 
-    return nn_lookup
+    # Faces among the first Oi of the face list absent from the neighbor list
+    absent_ij = nn_lookup.lookup(neighbors[:, :, None], rows[:, None, :]) == n_neighbors
+    dij = np.sum(absent_ij & (positions < o_i[:, :, None]), axis=2)
 
+    # Faces among the first Oj of the neighbor list absent from the face list
+    absent_ji = nn_lookup.lookup(faces[:, :, None], app_nearest_neighbors[neighbors]) == n_neighbors
+    dji = np.sum(absent_ji & (positions < o_j[:, :, None]), axis=2)
 
-def calculate_symmetric_dist_row(nearest_neighbors, nn_lookup, row_no):
-    dist_row = np.zeros([1, nearest_neighbors.shape[1]])
-    f1 = nn_lookup[row_no]
+    dist_rows = np.zeros(rows.shape)
+    dist_rows[:, 1:] = np.where(co_neighbor, (dij + dji) / np.minimum(o_i, o_j), INFINITE)
 
-    for idx, neighbor in enumerate(f1[1:]):
-        Oi = idx + 1
-        co_neighbor = True
+    return dist_rows
 
-        try:
-            row = nn_lookup[neighbor]
-            Oj = np.where(row == row_no)[0][0] + 1
-        except IndexError:
-            Oj = nearest_neighbors.shape[1] + 1
-            co_neighbor = False
 
-        f11 = set(f1[0:Oi])
-        f21 = set(nn_lookup[neighbor])
-        dij = len(f11.difference(f21))
+def create_neighbor_lookup(app_nearest_neighbors):
+    n_neighbors = app_nearest_neighbors.shape[1]
+    ranks = np.broadcast_to(np.arange(n_neighbors, dtype=np.min_scalar_type(n_neighbors)), app_nearest_neighbors.shape)
 
-        f12 = set(f1)
-        f22 = set(nn_lookup[neighbor][0:Oj])
-        dji = len(f22.difference(f12))
+    return SparseNeighborLookup(app_nearest_neighbors, ranks, n_neighbors)
 
-        if not co_neighbor:
-            dist_row[0, Oi] = INFINITE
-        else:
-            dist_row[0, Oi] = float(dij + dji) / min(Oi, Oj)
 
-    return dist_row
+def fill_symmetric_dist(app_nearest_neighbors, d, start, end):
+    nn_lookup = create_neighbor_lookup(app_nearest_neighbors)
+    block_size = max(1, SYMMETRIC_DIST_BLOCK_ELEMENTS // app_nearest_neighbors.shape[1] ** 2)
 
+    for block_start in range(start, end, block_size):
+        block_end = min(block_start + block_size, end)
+        d[block_start:block_end] = calculate_symmetric_dist_rows(app_nearest_neighbors, nn_lookup, block_start,
+                                                                 block_end)
 
-def calculate_symmetric_dist(app_nearest_neighbors):
-    nn_lookup = create_neighbor_lookup(app_nearest_neighbors)
-    d = np.zeros(app_nearest_neighbors.shape)
 
-    func = partial(calculate_symmetric_dist_row, app_nearest_neighbors, nn_lookup)
-    results = map(func, range(app_nearest_neighbors.shape[0]))
+def fill_symmetric_dist_shared(neighbors_name, dists_name, shape, dtype, rows_range):
+    neighbors_memory = SharedMemory(name=neighbors_name)
+    dists_memory = SharedMemory(name=dists_name)
 
-    for row_no, row_val in enumerate(results):
-        d[row_no, :] = row_val
+    app_nearest_neighbors = np.ndarray(shape, dtype=dtype, buffer=neighbors_memory.buf)
+    d = np.ndarray(shape, dtype="float64", buffer=dists_memory.buf)
 
-    return d
+    fill_symmetric_dist(app_nearest_neighbors, d, *rows_range)
 
+    del app_nearest_neighbors, d
+    neighbors_memory.close()
+    dists_memory.close()
 
-def aro_clustering(app_nearest_neighbors, distance_matrix, threshold):
-    clusters = []
 
-    nodes = set(list(np.arange(0, distance_matrix.shape[0])))
-    plausible_neighbors = create_plausible_neighbor_lookup(app_nearest_neighbors, distance_matrix, threshold)
+# Daemonic processes, such as the workers of the parameters grid search, can not start a pool of their own,
+# so there the rows are computed serially
+def calculate_symmetric_dist(app_nearest_neighbors, n_jobs=1):
+    d = np.zeros(app_nearest_neighbors.shape)
+
+    if n_jobs == 1 or current_process().daemon:
+        fill_symmetric_dist(app_nearest_neighbors, d, 0, len(app_nearest_neighbors))
 
-    while nodes:
-        # Get a node :
-        n = nodes.pop()
+        return d
 
-        # This contains the set of connected nodes :
-        group = {n}
+    # Workers read the neighbor array and write their rows of the result through shared memory
+    neighbors_memory = SharedMemory(create=True, size=app_nearest_neighbors.nbytes)
+    dists_memory = SharedMemory(create=True, size=d.nbytes)
 
-        # Build a queue with this node in it :
-        queue = [n]
+    try:
+        shared_neighbors = np.ndarray(app_nearest_neighbors.shape, dtype=app_nearest_neighbors.dtype,
+                                      buffer=neighbors_memory.buf)
+        shared_neighbors[:] = app_nearest_neighbors
 
-        # Iterate over the queue :
-        while queue:
-            n = queue.pop(0)
-            neighbors = plausible_neighbors[n]
-            # Remove neighbors we've already visited :
-            neighbors = nodes.intersection(neighbors)
-            neighbors.difference_update(group)
+        bounds = np.linspace(0, len(app_nearest_neighbors), n_jobs + 1).astype(int)
+        rows_ranges = list(zip(bounds[:-1], bounds[1:]))
 
-            # Remove nodes from the global set :
-            nodes.difference_update(neighbors)
+        func = partial(fill_symmetric_dist_shared, neighbors_memory.name, dists_memory.name,
+                       app_nearest_neighbors.shape, app_nearest_neighbors.dtype)
+        with Pool(processes=n_jobs) as p:
+            p.map(func, rows_ranges)
 
-            # Add the connected neighbors :
-            group.update(neighbors)
+        d[:] = np.ndarray(d.shape, dtype=d.dtype, buffer=dists_memory.buf)
+        del shared_neighbors
+    finally:
+        neighbors_memory.close()
+        neighbors_memory.unlink()
+        dists_memory.close()
+        dists_memory.unlink()
 
-            # Add the neighbors to the queue to visit them next :
-            queue.extend(neighbors)
-        # Add the group to the list of groups :
-        clusters.append(group)
+    return d
+
+
+# Clusters are the connected components of the plausible neighbor graph, transitively merging all the pairs within
+# the threshold as in the paper
+def aro_clustering(app_nearest_neighbors, distance_matrix, threshold):
+    plausible_neighbors = create_plausible_neighbor_graph(app_nearest_neighbors, distance_matrix, threshold)
+    _, labels = connected_components(plausible_neighbors, directed=False)
 
-    return clusters
+    return labels
 
 
-def create_plausible_neighbor_lookup(app_nearest_neighbors, distance_matrix, threshold):
+# The symmetric distance is not symmetric in its two faces: Oi is a position in the list of the face, while Oj is
+# a position in the list of the neighbor plus one. A pair may therefore be plausible in one direction only, and
+# the graph is made undirected, so that such a pair is merged either way.
+def create_plausible_neighbor_graph(app_nearest_neighbors, distance_matrix, threshold):
     n_vectors = app_nearest_neighbors.shape[0]
-    plausible_neighbors = {}
-    for i in range(n_vectors):
-        plausible_neighbors[i] = set(list(app_nearest_neighbors[i, np.where(distance_matrix[i, :] <= threshold)][0]))
 
-    return plausible_neighbors
+    plausible = distance_matrix <= threshold
+    rows = np.broadcast_to(np.arange(n_vectors)[:, None], app_nearest_neighbors.shape)[plausible]
+    columns = app_nearest_neighbors[plausible]
+
+    graph = csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(n_vectors, n_vectors))
+
+    return graph.maximum(graph.T)
 
 
 def cluster_app_rank_order(vectors, params_dict=None):
@@ -123,14 +145,11 @@ def cluster_app_rank_order(vectors, params_dict=None):
     n_neighbors = params_dict["n_neighbors"]
     threshold = params_dict["threshold"]
     distance = params_dict["distance"]
+    index = params_dict.get("index", "flann")
+    n_jobs = params_dict.get("n_jobs", 1)
 
-    app_nearest_neighbors, dists = build_index(vectors, n_neighbors, distance)
-    distance_matrix = calculate_symmetric_dist(app_nearest_neighbors)
-    clusters_th = aro_clustering(app_nearest_neighbors, distance_matrix, threshold)
-
-    labels = [0 for _ in range(len(vectors))]
-    for idx, cluster in enumerate(clusters_th):
-        for image_idx in cluster:
-            labels[image_idx] = idx
+    app_nearest_neighbors, dists = build_index(vectors, n_neighbors, distance, index)
+    distance_matrix = calculate_symmetric_dist(app_nearest_neighbors, n_jobs)
+    labels = aro_clustering(app_nearest_neighbors, distance_matrix, threshold)
 
     return labels
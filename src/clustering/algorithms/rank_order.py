@@ -1,69 +1,83 @@
-import pyflann
 import numpy as np
 
-from itertools import combinations, product
+from src.clustering.nearest_neighbors import find_nearest_neighbors, SparseNeighborLookup
 
+# Neighbor lists hold this many neighbors per k_neighbors unless n_neighbors is given, with None for full lists
+NEIGHBORS_PER_K = 10
 
-def build_index(vectors, distance="euclidean"):
-    pyflann.set_distance_type(distance_type=distance)
 
-    flann = pyflann.FLANN()
-    params = flann.build_index(vectors, algorithm='linear')
+# Distances are in the scale of the original FLANN index, squared for euclidean, as the normalized distance test
+# against phi depends on it and the thresholds were tuned for it
+def build_index(vectors, n_neighbors=None, distance="euclidean", index="exact"):
+    if n_neighbors is None:
+        n_neighbors = len(vectors)
 
-    order_list, dists = flann.nn_index(vectors, len(vectors), checks=params['checks'])
-    order_list.astype(int)
+    return find_nearest_neighbors(vectors, n_neighbors, index=index, distance=distance, squared=True)
 
-    return order_list, dists
 
+# When only the top neighbors are kept, faces outside of the list are ranked right after its end
+def create_neighbor_lookup(fs):
+    n_neighbors = fs.shape[1]
+    ranks = np.broadcast_to(np.arange(n_neighbors, dtype=np.min_scalar_type(n_neighbors)), fs.shape)
 
-def create_neighbor_lookups(fs, dists):
-    os = np.zeros(fs.shape, dtype=int)
-    face_dists = np.zeros(fs.shape)
-
-    for i, j in product(range(len(fs)), repeat=2):
-        face_dists[i][fs[i][j]] = dists[i][j]
-        os[i][fs[i][j]] = j
-
-    return os, face_dists
+    return SparseNeighborLookup(fs, ranks, n_neighbors)
 
 
 def cluster_rank_order(vectors, params_dict=None):
     distance = params_dict["distance"]
     k = params_dict["k_neighbors"]
     threshold = params_dict["threshold"]
+    n_neighbors = params_dict.get("n_neighbors", NEIGHBORS_PER_K * k)
+    index = params_dict.get("index", "exact")
+
+    if n_neighbors is not None:
+        n_neighbors = max(n_neighbors, k + 1)
 
-    fs, dists = build_index(vectors, distance=distance)
-    os, faces_dists = create_neighbor_lookups(fs, dists)
-    clusters_dists = faces_dists.copy()
+    fs, dists = build_index(vectors, n_neighbors, distance=distance, index=index)
+    os = create_neighbor_lookup(fs)
+    ranks = np.arange(fs.shape[1], dtype=os.Values.dtype)
 
     clusters = dict({i: [i] for i in range(len(vectors))})
     merged_into = [i for i in range(len(clusters))]
 
+    # Rows of the clusters distance table hold only the faces that have been seen in the neighbor lists,
+    # all the other faces are infinitely far away. Each row is sorted by face index.
+    order = np.argsort(fs, axis=1)
+    clusters_neighbors = list(np.take_along_axis(fs, order, axis=1))
+    clusters_dists = list(np.take_along_axis(dists, order, axis=1))
+
+    # Sums of the mean distances to the k nearest neighbors over the faces of each cluster, used for phi
+    knn_dists_sums = dists[:, 1:k + 1].mean(axis=1, dtype="float64")
+    clusters_sizes = np.ones(len(vectors), dtype=int)
+    alive = np.ones(len(vectors), dtype=bool)
+
     def rank_order_distance(c1, c2):
-        d_c1_c2 = np.sum(os[c2][fs[c1][i]] for i in range(os[c1][c2]))
-        d_c2_c1 = np.sum(os[c1][fs[c2][i]] for i in range(os[c2][c1]))
+        o_c1_c2 = os.lookup(c1, c2)
+        o_c2_c1 = os.lookup(c2, c1)
 
-        return (d_c1_c2 + d_c2_c1) / min(os[c1][c2], os[c2][c1])
+        d_c1_c2 = os.lookup(c2, fs[c1][:o_c1_c2]).sum(dtype=int)
+        d_c2_c1 = os.lookup(c1, fs[c2][:o_c2_c1]).sum(dtype=int)
 
-    def rank_order_distance_normalized(c1, c2):
-        return (1 / phi(c1, c2)) * clusters_dists[c1][c2]
+        return (d_c1_c2 + d_c2_c1) / min(o_c1_c2, o_c2_c1)
 
     def phi(c1, c2):
-        result = 1 / (len(clusters[c1]) + len(clusters[c2]))
-        result *= np.sum(
-            (1 / k) * np.sum(faces_dists[a][fs[a][i]] for i in range(1, k + 1)) for a in clusters[c1] + clusters[c2])
-
-        return result
+        return (knn_dists_sums[c1] + knn_dists_sums[c2]) / (clusters_sizes[c1] + clusters_sizes[c2])
 
-    to_be_merged = True
-    while to_be_merged:
-        to_be_merged = False
+    # A pair only needs to be evaluated again if one of its clusters has changed during the previous merge
+    touched = np.ones(len(vectors), dtype=bool)
+    while touched.any():
         merging_candidates = []
-        for ci, cj in combinations(clusters.keys(), 2):
-            if rank_order_distance(ci, cj) < threshold and rank_order_distance_normalized(ci, cj) < 1:
-                to_be_merged = True
-                merging_candidates.append((ci, cj))
+        for ci in clusters.keys():
+            neighbors = clusters_neighbors[ci]
 
+            candidates = (neighbors > ci) & alive[neighbors] & (touched[ci] | touched[neighbors])
+            candidates &= clusters_dists[ci] < phi(ci, neighbors)
+
+            for cj in neighbors[candidates].tolist():
+                if rank_order_distance(ci, cj) < threshold:
+                    merging_candidates.append((ci, cj))
+
+        touched[:] = False
         for ci, cj in merging_candidates:
             while merged_into[ci] != ci or merged_into[cj] != cj:
                 old_ci = ci
@@ -82,13 +96,26 @@ def cluster_rank_order(vectors, params_dict=None):
             clusters.pop(cj)
             merged_into[cj] = ci
 
-            lower_indices = np.where(clusters_dists[cj] < clusters_dists[ci])
-            clusters_dists[ci][lower_indices] = clusters_dists[cj][lower_indices]
+            knn_dists_sums[ci] += knn_dists_sums[cj]
+            clusters_sizes[ci] += clusters_sizes[cj]
+            alive[cj] = False
+            touched[ci] = True
+
+            merged_neighbors = np.concatenate([clusters_neighbors[ci], clusters_neighbors[cj]])
+            merged_dists = np.concatenate([clusters_dists[ci], clusters_dists[cj]])
+
+            order = np.lexsort((merged_dists, merged_neighbors))
+            merged_neighbors = merged_neighbors[order]
+            merged_dists = merged_dists[order]
+
+            closest = np.ones(len(merged_neighbors), dtype=bool)
+            closest[1:] = merged_neighbors[1:] != merged_neighbors[:-1]
 
-            fs[ci] = np.argsort(clusters_dists[ci])
+            clusters_neighbors[ci] = merged_neighbors[closest]
+            clusters_dists[ci] = merged_dists[closest]
 
-            for i in range(len(fs)):
-                os[ci][fs[ci][i]] = i
+            fs[ci] = clusters_neighbors[ci][np.argsort(clusters_dists[ci], kind="stable")[:fs.shape[1]]]
+            os.update(ci, fs[ci], ranks)
 
     labels = [0 for _ in range(len(vectors))]
     for idx, cluster in clusters.items():
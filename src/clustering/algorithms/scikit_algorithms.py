@@ -1,7 +1,53 @@
 from sklearn.cluster import KMeans, DBSCAN, MeanShift, AffinityPropagation, SpectralClustering, AgglomerativeClustering, \
     OPTICS
 
-from src.clustering.clustering_utils import find_euclidean_distance
+from src.clustering.clustering_utils import find_euclidean_distance, find_taxicab_distance, pairwise_distances, \
+    radius_neighbors_graph, DISTANCE_NAMES
+
+# Distances with a scikit-learn counterpart are left to its neighbor trees, which never build an n x n matrix
+NATIVE_METRICS = {
+    find_euclidean_distance: "euclidean",
+    find_taxicab_distance: "manhattan"
+}
+
+MAX_PRECOMPUTED_ELEMENTS = 2 ** 28
+
+
+def use_native_metric(params_dict):
+    metric = params_dict.get("metric")
+
+    if callable(metric) and metric in NATIVE_METRICS:
+        params_dict = dict(params_dict, metric=NATIVE_METRICS[metric])
+
+    return params_dict
+
+
+# Other distances of clustering_utils, such as find_cosine_similarity, are precomputed with the pairwise engine.
+# DBSCAN only needs the pairs within eps, so it gets a sparse graph of them built in blocks.
+def precompute_radius_neighbors(vectors, params_dict):
+    params_dict = use_native_metric(params_dict)
+    metric = params_dict.get("metric")
+
+    if callable(metric) and metric in DISTANCE_NAMES:
+        vectors = radius_neighbors_graph(vectors, params_dict.get("eps", 0.5), distance=metric)
+        params_dict = dict(params_dict, metric="precomputed")
+
+    return vectors, params_dict
+
+
+def precompute_distances(vectors, params_dict):
+    params_dict = use_native_metric(params_dict)
+    metric = params_dict.get("metric")
+
+    if callable(metric) and metric in DISTANCE_NAMES:
+        if len(vectors) ** 2 > MAX_PRECOMPUTED_ELEMENTS:
+            raise ValueError(f"Precomputing {DISTANCE_NAMES[metric]} distances of {len(vectors)} vectors would take "
+                             f"{len(vectors) ** 2 * 4 / 2 ** 30:.1f}GB, use a metric with a scikit-learn counterpart")
+
+        vectors = pairwise_distances(vectors, distance=metric)
+        params_dict = dict(params_dict, metric="precomputed")
+
+    return vectors, params_dict
 
 
 def cluster_kmeans(vectors, params_dict=None):
@@ -17,6 +63,7 @@ def cluster_dbscan(vectors, params_dict=None):
     if params_dict is None:
         params_dict = {"eps": 1, "min_samples": 1, "metric": find_euclidean_distance}
 
+    vectors, params_dict = precompute_radius_neighbors(vectors, params_dict)
     evaluator = DBSCAN(**params_dict)
 
     return evaluator.fit_predict(vectors)
@@ -62,6 +109,7 @@ def cluster_optics(vectors, params_dict=None):
     if params_dict is None:
         params_dict = {"min_samples": 5, "metric": find_euclidean_distance}
 
+    vectors, params_dict = precompute_distances(vectors, params_dict)
     evaluator = OPTICS(**params_dict)
 
     return evaluator.fit_predict(vectors)
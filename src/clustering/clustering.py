@@ -1,25 +1,60 @@
 import numpy as np
 
-from src.clustering.clustering_utils import l2_normalize
+from src.clustering.clustering_utils import l2_normalize, fit_pca, project_vectors, save_projection, load_projection
+from src.embedding.embeddings_store import is_embeddings_store, load_embeddings_store
 
 
+# Vectors can be compacted after normalization, either by a PCA projection with n_components fitted on the vectors
+# or by a projection saved in projection_path, and stored as float16 instead of float32. Projected vectors are
+# normalized again, so that distance thresholds keep the same scale.
 class ImageClusteringUnit:
 
-    def __init__(self, embedding_path, normalize=True):
-        self.Paths = list()
-        self.Vectors = list()
+    def __init__(self, embedding_path, normalize=True, n_components=None, whiten=False, projection_path=None,
+                 dtype="float32"):
+        if is_embeddings_store(embedding_path):
+            self.Paths, self.Vectors, header = load_embeddings_store(embedding_path)
+            normalized = header["normalized"]
+        else:
+            self.Paths, self.Vectors = self.load_text_embeddings(embedding_path)
+            normalized = False
+
+        if normalize and not normalized:
+            self.Vectors = l2_normalize(self.Vectors)
+
+        self.Projection = None
+        if projection_path is not None:
+            self.Projection = load_projection(projection_path)
+        elif n_components is not None:
+            self.Projection = fit_pca(self.Vectors, n_components, whiten)
+
+        if self.Projection is not None:
+            self.Vectors = project_vectors(self.Vectors, *self.Projection)
+
+            if normalize:
+                self.Vectors = l2_normalize(self.Vectors)
+
+        self.Vectors = self.Vectors.astype(dtype, copy=False)
+
+    @staticmethod
+    def load_text_embeddings(embedding_path):
+        paths = list()
+        vectors = list()
 
         with open(embedding_path, "r") as embeddings:
             for line in embeddings.readlines():
                 path, vector_str = line.split("\t")
                 vector = np.fromstring(vector_str, dtype="float32", sep=" ")
 
-                self.Paths.append(path)
-                self.Vectors.append(vector)
+                paths.append(path)
+                vectors.append(vector)
 
-        self.Vectors = np.asarray(self.Vectors)
-        if normalize:
-            self.Vectors = l2_normalize(self.Vectors)
+        return paths, np.asarray(vectors)
+
+    def save_projection(self, projection_path):
+        if self.Projection is None:
+            raise ValueError("No projection to save, the vectors were not compacted")
+
+        save_projection(projection_path, *self.Projection)
 
     def get_total_vectors_number(self):
         return len(self.Vectors)
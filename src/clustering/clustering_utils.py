@@ -1,5 +1,7 @@
 import numpy as np
 from numpy.linalg import norm
+from scipy.sparse import csr_matrix
+from scipy.spatial.distance import cdist
 
 
 def find_euclidean_distance(considered_representation, other_representations):
@@ -32,3 +34,155 @@ def l2_normalize(x):
     return x / np.sqrt(np.sum(np.multiply(x, x), axis=x.ndim - 1))[:, None]
 
 
+# Pairwise distance engine. Distances between two embedding matrices are computed with matrix multiplications
+# (||a||^2 + ||b||^2 - 2ab for euclidean, plain dot products for cosine) in row blocks, so that the full n x n matrix
+# never has to be materialized unless requested.
+
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def squared_norms(x):
+    return np.einsum("ij,ij->i", x, x)
+
+
+def euclidean_distance_block(x, y, y_squared_norms=None):
+    if y_squared_norms is None:
+        y_squared_norms = squared_norms(y)
+
+    block = np.dot(x, y.T)
+    block *= -2
+    block += squared_norms(x)[:, None]
+    block += y_squared_norms[None, :]
+
+    np.maximum(block, 0, out=block)
+    np.sqrt(block, out=block)
+
+    return block
+
+
+def cosine_distance_block(x, y, y_squared_norms=None):
+    if y_squared_norms is None:
+        y_squared_norms = squared_norms(y)
+
+    block = np.dot(x, y.T)
+    block /= np.sqrt(squared_norms(x))[:, None]
+    block /= np.sqrt(y_squared_norms)[None, :]
+
+    # Same scale as find_cosine_similarity: 1 - (cos + 1) / 2
+    block *= -0.5
+    block += 0.5
+
+    return block
+
+
+def taxicab_distance_block(x, y, y_squared_norms=None):
+    return cdist(x, y, metric="cityblock").astype(x.dtype, copy=False)
+
+
+BLOCK_DISTANCES = {
+    "euclidean": euclidean_distance_block,
+    "cosine": cosine_distance_block,
+    "manhattan": taxicab_distance_block
+}
+
+DISTANCE_NAMES = {
+    find_euclidean_distance: "euclidean",
+    find_cosine_similarity: "cosine",
+    find_taxicab_distance: "manhattan"
+}
+
+
+def get_distance_name(distance):
+    if callable(distance):
+        distance = DISTANCE_NAMES.get(distance)
+
+    if distance not in BLOCK_DISTANCES:
+        raise ValueError(f"Unsupported distance for pairwise computation: {distance}")
+
+    return distance
+
+
+def pairwise_distances_chunked(x, y=None, distance="euclidean", block_size=DEFAULT_BLOCK_SIZE, dtype="float32"):
+    distance_block = BLOCK_DISTANCES[get_distance_name(distance)]
+
+    x = np.asarray(x, dtype=dtype)
+    y = x if y is None else np.asarray(y, dtype=dtype)
+    y_squared_norms = squared_norms(y)
+
+    for start in range(0, len(x), block_size):
+        end = min(start + block_size, len(x))
+
+        yield start, end, distance_block(x[start:end], y, y_squared_norms)
+
+
+def pairwise_distances(x, y=None, distance="euclidean", block_size=DEFAULT_BLOCK_SIZE, dtype="float32"):
+    n_columns = len(x) if y is None else len(y)
+    distances = np.empty((len(x), n_columns), dtype=dtype)
+
+    for start, end, block in pairwise_distances_chunked(x, y, distance, block_size, dtype):
+        distances[start:end] = block
+
+    return distances
+
+
+# Sparse matrix of the distances within radius, built block by block, so that its memory scales with the number of
+# pairs within radius rather than with n x n. Zero distances are stored explicitly, so they remain neighbors.
+def radius_neighbors_graph(x, radius, distance="euclidean", block_size=DEFAULT_BLOCK_SIZE, dtype="float32"):
+    rows, columns, values = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)], [np.empty(0, dtype=dtype)]
+
+    for start, end, block in pairwise_distances_chunked(x, distance=distance, block_size=block_size, dtype=dtype):
+        block_rows, block_columns = np.nonzero(block <= radius)
+
+        rows.append(block_rows + start)
+        columns.append(block_columns)
+        values.append(block[block_rows, block_columns])
+
+    return csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                      shape=(len(x), len(x)))
+
+
+# Embeddings compaction. A PCA projection is fitted on the covariance matrix, which is accumulated over row blocks and
+# is only dimension x dimension, so fitting it never copies the whole embeddings matrix.
+
+def fit_pca(vectors, n_components, whiten=False, block_size=DEFAULT_BLOCK_SIZE):
+    vectors_num, dimension = vectors.shape
+    if not 0 < n_components <= dimension:
+        raise ValueError(f"Expected between 1 and {dimension} PCA components, got {n_components}")
+
+    mean = np.zeros(dimension, dtype="float64")
+    for start in range(0, vectors_num, block_size):
+        mean += np.sum(vectors[start:start + block_size], axis=0, dtype="float64")
+    mean /= vectors_num
+
+    covariance = np.zeros((dimension, dimension), dtype="float64")
+    for start in range(0, vectors_num, block_size):
+        centered = vectors[start:start + block_size] - mean
+        covariance += np.dot(centered.T, centered)
+    covariance /= max(vectors_num - 1, 1)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:n_components]
+    components = eigenvectors[:, order]
+
+    if whiten:
+        components /= np.sqrt(np.maximum(eigenvalues[order], np.finfo("float32").eps))
+
+    return mean.astype("float32"), components.astype("float32")
+
+
+def project_vectors(vectors, mean, components, block_size=DEFAULT_BLOCK_SIZE):
+    projected = np.empty((len(vectors), components.shape[1]), dtype="float32")
+
+    for start in range(0, len(vectors), block_size):
+        projected[start:start + block_size] = np.dot(vectors[start:start + block_size] - mean, components)
+
+    return projected
+
+
+def save_projection(projection_path, mean, components):
+    np.savez(projection_path, mean=mean, components=components)
+
+
+def load_projection(projection_path):
+    with np.load(projection_path) as projection:
+        return projection["mean"], projection["components"]
@@ -0,0 +1,107 @@
+import numpy as np
+
+from src.clustering.clustering_utils import pairwise_distances_chunked, get_distance_name, DEFAULT_BLOCK_SIZE
+
+
+# Every index returns neighbors as an int32 array and distances as a float32 array, both of shape
+# (n_vectors, n_neighbors), ordered by distance and with each vector being its own first neighbor.
+# With squared, euclidean distances are squared, which is the scale FLANN reports them in.
+
+def find_neighbors_exact(vectors, n_neighbors, distance="euclidean", squared=False, block_size=DEFAULT_BLOCK_SIZE):
+    n_neighbors = min(n_neighbors, len(vectors))
+    neighbors = np.empty((len(vectors), n_neighbors), dtype="int32")
+    dists = np.empty((len(vectors), n_neighbors), dtype="float32")
+
+    for start, end, block in pairwise_distances_chunked(vectors, distance=distance, block_size=block_size):
+        rows = np.arange(end - start)
+        block[rows, rows + start] = -np.inf
+
+        if n_neighbors < block.shape[1]:
+            top = np.argpartition(block, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            top_dists = np.take_along_axis(block, top, axis=1)
+
+            order = np.argsort(top_dists, axis=1, kind="stable")
+            neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+            dists[start:end] = np.take_along_axis(top_dists, order, axis=1)
+        else:
+            order = np.argsort(block, axis=1, kind="stable")
+            neighbors[start:end] = order
+            dists[start:end] = np.take_along_axis(block, order, axis=1)
+
+    dists[:, 0] = 0
+
+    if squared and get_distance_name(distance) == "euclidean":
+        np.square(dists, out=dists)
+
+    return neighbors, dists
+
+
+def find_neighbors_flann(vectors, n_neighbors, distance="euclidean", squared=False, algorithm="kdtree",
+                         **index_params):
+    import pyflann
+
+    # FLANN indexes float32, float64, uint8 and int32 vectors only, while compacted embeddings may be float16
+    vectors = np.asarray(vectors)
+    if vectors.dtype == np.float16:
+        vectors = vectors.astype("float32")
+
+    n_neighbors = min(n_neighbors, len(vectors))
+
+    pyflann.set_distance_type(distance_type=distance)
+    flann = pyflann.FLANN()
+    params = flann.build_index(vectors, algorithm=algorithm, **index_params)
+
+    neighbors, dists = flann.nn_index(vectors, n_neighbors, checks=params['checks'])
+    neighbors = neighbors.reshape(len(vectors), n_neighbors).astype("int32")
+    dists = dists.reshape(len(vectors), n_neighbors).astype("float32")
+
+    # FLANN reports squared euclidean distances
+    if distance == "euclidean" and not squared:
+        dists = np.sqrt(dists)
+
+    return neighbors, dists
+
+
+NEIGHBORS_INDICES = {
+    "exact": (find_neighbors_exact, {}),
+    "flann": (find_neighbors_flann, {"algorithm": "kdtree", "trees": 4}),
+    "flann_kmeans": (find_neighbors_flann, {"algorithm": "kmeans", "branching": 32, "iterations": 7})
+}
+
+
+def find_nearest_neighbors(vectors, n_neighbors, index="exact", distance="euclidean", squared=False, **index_params):
+    if index not in NEIGHBORS_INDICES:
+        raise ValueError(f"Unknown nearest neighbors index: {index}")
+
+    find_neighbors, default_params = NEIGHBORS_INDICES[index]
+
+    return find_neighbors(vectors, n_neighbors, distance, squared, **dict(default_params, **index_params))
+
+
+# Keeps only the (face, neighbor) pairs present in the neighbor lists, keyed by face * n_vectors + neighbor.
+# The keys are sorted, so that lookups are binary searches.
+class SparseNeighborLookup:
+
+    def __init__(self, fs, values, default):
+        n_vectors = fs.shape[0]
+        order = np.argsort(fs, axis=1)
+
+        self.NVectors = n_vectors
+        self.NNeighbors = fs.shape[1]
+        self.Default = default
+        self.Keys = (np.arange(n_vectors, dtype="int64")[:, None] * n_vectors + np.take_along_axis(fs, order, axis=1))
+        self.Keys = self.Keys.ravel()
+        self.Values = np.take_along_axis(values, order, axis=1).ravel()
+
+    def lookup(self, faces, neighbors):
+        keys = np.asarray(faces, dtype="int64") * self.NVectors + neighbors
+        positions = np.minimum(np.searchsorted(self.Keys, keys), len(self.Keys) - 1)
+
+        return np.where(self.Keys[positions] == keys, self.Values[positions], self.Default)
+
+    def update(self, face, neighbors, values):
+        order = np.argsort(neighbors)
+        row = slice(face * self.NNeighbors, (face + 1) * self.NNeighbors)
+
+        self.Keys[row] = face * self.NVectors + neighbors[order]
+        self.Values[row] = values[order]
@@ -0,0 +1,140 @@
+import time
+import sqlite3
+import hashlib
+
+import numpy as np
+
+DEFAULT_MAX_SIZE = 2 ** 30
+LOOKUP_CHUNK_SIZE = 500
+
+
+def hash_file(path, block_size=2 ** 20):
+    file_hash = hashlib.sha1()
+
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+# Persistent cache of embeddings keyed by image content hash and model key. The model key covers the model name,
+# its weights file hash and the preprocessing settings. Least recently used entries are evicted once the total
+# size of the stored embeddings exceeds max_size bytes.
+class EmbeddingsCache:
+    DefaultCachePath = "./results/embeddings/cache.sqlite"
+
+    def __init__(self, cache_path=DefaultCachePath, max_size=DEFAULT_MAX_SIZE):
+        self.CachePath = cache_path.replace("\\", "/")
+        self.MaxSize = max_size
+        self.WeightsHashes = dict()
+
+        self.Hits = 0
+        self.Misses = 0
+        self.TimeSaved = 0
+
+        self.Connection = sqlite3.connect(self.CachePath)
+        self.Connection.execute("CREATE TABLE IF NOT EXISTS embeddings (image_hash TEXT, model_key TEXT, "
+                                "embedding BLOB, inference_time REAL, last_access REAL, "
+                                "PRIMARY KEY (image_hash, model_key))")
+        self.Connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.Connection.commit()
+
+        self.Size = self.get_total_size()
+
+    def get_total_size(self):
+        return self.Connection.execute("SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings").fetchone()[0]
+
+    def get_model_key(self, model):
+        weights_path = model.WeightsPath
+
+        if weights_path is not None and weights_path not in self.WeightsHashes:
+            self.WeightsHashes[weights_path] = hash_file(weights_path)
+
+        weights_hash = self.WeightsHashes.get(weights_path, "none")
+        preprocessing = f"{type(model).__module__}.{type(model).__qualname__}|{model.InputSize}|INTER_CUBIC"
+
+        # Embeddings of an inference backend differ from the Keras ones, quantized ones noticeably and depending
+        # on their calibration sample
+        if model.InferenceBackend is not None:
+            preprocessing += f"|{model.InferenceBackendKey}"
+
+        return hashlib.sha1(f"{model.Name}|{weights_hash}|{preprocessing}".encode()).hexdigest()
+
+    @staticmethod
+    def get_image_hash(image_path):
+        return hash_file(image_path)
+
+    def lookup(self, model_key, image_hashes):
+        image_hashes = list(set(image_hashes))
+        found = dict()
+
+        for start in range(0, len(image_hashes), LOOKUP_CHUNK_SIZE):
+            chunk = image_hashes[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+
+            rows = self.Connection.execute(f"SELECT image_hash, embedding, inference_time FROM embeddings "
+                                           f"WHERE model_key = ? AND image_hash IN ({placeholders})",
+                                           [model_key] + chunk)
+
+            for image_hash, embedding, inference_time in rows:
+                found[image_hash] = np.frombuffer(embedding, dtype="float32")
+                self.TimeSaved += inference_time
+
+        now = time.time()
+        self.Connection.executemany("UPDATE embeddings SET last_access = ? WHERE image_hash = ? AND model_key = ?",
+                                    [(now, image_hash, model_key) for image_hash in found])
+        self.Connection.commit()
+
+        self.Hits += len(found)
+        self.Misses += len(image_hashes) - len(found)
+
+        return found
+
+    def store(self, model_key, image_hashes, embeddings, inference_time):
+        embeddings = np.asarray(embeddings, dtype="float32")
+        time_per_image = inference_time / max(len(embeddings), 1)
+        now = time.time()
+
+        rows = [(image_hash, model_key, embedding.tobytes(), time_per_image, now)
+                for image_hash, embedding in zip(image_hashes, embeddings)]
+
+        self.Size += sum(len(row[2]) for row in rows)
+        self.Connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        self.Connection.commit()
+
+        if self.Size > self.MaxSize:
+            self.evict()
+
+    def evict(self):
+        self.Size = self.get_total_size()
+        rows = self.Connection.execute("SELECT image_hash, model_key, LENGTH(embedding) FROM embeddings "
+                                       "ORDER BY last_access")
+        evicted = list()
+
+        for image_hash, model_key, size in rows:
+            if self.Size <= self.MaxSize:
+                break
+
+            evicted.append((image_hash, model_key))
+            self.Size -= size
+
+        self.Connection.executemany("DELETE FROM embeddings WHERE image_hash = ? AND model_key = ?", evicted)
+        self.Connection.commit()
+
+    def get_stats_report(self):
+        total = self.Hits + self.Misses
+        hit_rate = self.Hits / total if total > 0 else 0
+
+        return (f"Embeddings cache: {self.Hits} hits, {self.Misses} misses, hit rate {hit_rate:.2%}, "
+                f"saved {self.TimeSaved:.2f}s of inference, {self.Size / 2 ** 20:.1f}MB of "
+                f"{self.MaxSize / 2 ** 20:.1f}MB used")
+
+    def close(self):
+        self.Connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
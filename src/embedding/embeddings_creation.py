@@ -1,16 +1,26 @@
-from src.image_processing.image_loader import ImageLoader
+from src.image_processing.image_loader import ImageLoader, prepare_image
+from src.embedding.embeddings_store import EmbeddingsStoreWriter, export_embeddings_text, merge_embeddings_stores
+from multiprocessing import get_context
+from functools import partial
 from timeit import default_timer
 from abc import abstractmethod
+from collections import deque
+from contextlib import ExitStack
 from tqdm import tqdm
 
-from numpy import array_str
+import os
+import shutil
 import numpy as np
-import sys
 
 
 class AbstractEmbeddingModel:
     InputShape = None
     InputSize = None
+    NormalizedOutput = False
+    BatchSize = 32
+    WeightsPath = None
+    InferenceBackend = None
+    InferenceBackendKey = None
 
     @staticmethod
     @abstractmethod
@@ -21,40 +31,264 @@ class AbstractEmbeddingModel:
     def predict(self, x):
         ...
 
+    # Stacks preprocessed images, each having a batch axis of size 1, and predicts them in one call
+    def predict_batch(self, images):
+        return self.predict(np.concatenate(images, axis=0))
+
+    # Objects referenced by the model layers, which are needed to deserialize a cached model
+    @staticmethod
+    def get_custom_objects():
+        return dict()
+
+    def load_model(self, build_func, models_cache=None):
+        if models_cache is None:
+            return build_func()
+
+        return models_cache.load(self, build_func)
+
+    # Replaces the Keras model by an optimized inference model of the given backend, which has the same predict method
+    def set_inference_backend(self, backend, models_cache=None, **backend_params):
+        from src.embedding.inference_backends import create_inference_model, get_inference_backend_key, \
+            QUANTIZED_BACKENDS
+
+        self.Model = create_inference_model(self, backend, models_cache, **backend_params)
+        self.InferenceBackend = backend
+        self.InferenceBackendKey = get_inference_backend_key(backend, **backend_params)
+
+        # Stores of quantized embeddings are not marked normalized, so that they are normalized before clustering
+        if backend in QUANTIZED_BACKENDS:
+            self.NormalizedOutput = False
+
 
 class ImageEmbeddingsCreator:
-    DefaultEmbeddingsPath = "./results/embeddings/embeddings.txt"
+    DefaultEmbeddingsPath = "./results/embeddings/embeddings"
     EmbeddingsCreationTime = 0
     ImagePreprocessingTime = 0
 
-    def __init__(self, faces_path):
+    def __init__(self, faces_path, loader_workers=0, loader_processes=False):
         self.FacesPath = faces_path.replace("\\", "/")
+        self.LoaderWorkers = loader_workers
+        self.LoaderProcesses = loader_processes
+
+    def create_embeddings(self, model, save_path=DefaultEmbeddingsPath, batch_size=None, text_export=False,
+                          cache=None, image_paths=None, progress=True, resume=False):
+        if batch_size is None:
+            batch_size = model.BatchSize
 
-    def create_embeddings(self, model, save_path=DefaultEmbeddingsPath):
         self.EmbeddingsCreationTime = 0
         self.ImagePreprocessingTime = 0
 
         save_path = save_path.replace("\\", "/")
-        loader = ImageLoader(self.FacesPath, preproc_func=model.preprocess_input, target_size=model.InputSize)
+        loader = ImageLoader(self.FacesPath, preproc_func=model.preprocess_input, target_size=model.InputSize,
+                             workers=self.LoaderWorkers, processes=self.LoaderProcesses)
+
+        if image_paths is not None:
+            loader.ImagesList = list(image_paths)
+
+        with EmbeddingsStoreWriter(save_path, model.Name, model.NormalizedOutput, resume=resume) as writer:
+            # A resumed store already holds the embeddings of a part of the images, only the rest are appended
+            if writer.CompletedPaths:
+                completed = set(writer.CompletedPaths)
+                loader.ImagesList = [image_path for image_path in loader.ImagesList if image_path not in completed]
+
+            image_paths = loader.ImagesList
+            image_hashes = dict()
+            cached = dict()
+
+            # Only the images missing from the cache are loaded and go through the model
+            if cache is not None:
+                model_key = cache.get_model_key(model)
+                image_hashes = {image_path: cache.get_image_hash(image_path) for image_path in image_paths}
+                found = cache.lookup(model_key, image_hashes.values())
+
+                cached = {image_path: found[image_hash] for image_path, image_hash in image_hashes.items()
+                          if image_hash in found}
+                loader.ImagesList = [image_path for image_path in image_paths if image_path not in cached]
+
+            loaded_images = loader.next_image()
+            progress_bar = tqdm(image_paths, desc=model.Name, leave=True, disable=not progress)
+
+            # Embeddings are written in the order of images, so cached ones wait for preceding missing ones
+            pending = deque()
+            images = list()
+            missing = list()
+
+            for image_path in progress_bar:
+                entry = [image_path, cached.get(image_path)]
+                pending.append(entry)
+
+                if entry[1] is None:
+                    image, _ = next(loaded_images)
+                    images.append(image)
+                    missing.append(entry)
+
+                    if len(images) == batch_size:
+                        self.predict_missing(model, images, missing, image_hashes, cache)
+
+                        images = list()
+                        missing = list()
+
+                self.write_ready(pending, writer)
+
+            if images:
+                self.predict_missing(model, images, missing, image_hashes, cache)
+
+            self.write_ready(pending, writer)
+
+        self.ImagePreprocessingTime = loader.ImagePreprocessingTime + loader.ImageResizeTime
+
+        if text_export:
+            export_embeddings_text(save_path, f"{save_path}.txt")
+
+    def predict_missing(self, model, images, missing, image_hashes, cache):
+        start = default_timer()
+        result = model.predict_batch(images)
+        end = default_timer()
+
+        self.EmbeddingsCreationTime += (end - start)
+
+        for entry, embedding in zip(missing, result):
+            entry[1] = embedding
+
+        if cache is not None:
+            cache.store(cache.get_model_key(model), [image_hashes[image_path] for image_path, _ in missing], result,
+                        end - start)
+
+    # Splits the images into contiguous shards, one per worker process. Every worker constructs the model once with
+    # a fixed intra-op thread budget and writes its own shard store, and the shards are merged in order into a store
+    # named after the model in save_dir, whose path is returned.
+    def create_embeddings_sharded(self, model_constructor, kwargs, save_dir, workers=2, intra_op_threads=1,
+                                  batch_size=None, models_cache=None, resume=False):
+        save_dir = save_dir.replace("\\", "/")
+        image_paths = ImageLoader(self.FacesPath).ImagesList
+
+        shards_num = max(min(workers, len(image_paths)), 1)
+        shards_dir = f"{save_dir}/{model_constructor.__qualname__}.shards"
+        if not os.path.exists(shards_dir):
+            os.mkdir(shards_dir)
+
+        bounds = np.linspace(0, len(image_paths), shards_num + 1).astype(int)
+        shards = [(f"{shards_dir}/shard_{idx}", image_paths[bounds[idx]:bounds[idx + 1]]) for idx in range(shards_num)]
+
+        create_shard = partial(create_embeddings_shard, self.FacesPath, model_constructor, kwargs, models_cache,
+                               intra_op_threads, batch_size, self.LoaderWorkers, resume)
+
+        # Workers are spawned rather than forked, as TensorFlow does not survive a fork
+        start = default_timer()
+        with get_context("spawn").Pool(processes=shards_num) as pool:
+            self.ShardsReports = pool.map(create_shard, shards)
+        end = default_timer()
+
+        save_path = f"{save_dir}/{self.ShardsReports[0]['model']}"
+        merge_embeddings_stores([shard_path for shard_path, _ in shards], save_path)
+        shutil.rmtree(shards_dir)
+
+        self.EmbeddingsCreationTime = sum(report["creation_time"] for report in self.ShardsReports)
+        self.ImagePreprocessingTime = sum(report["preprocessing_time"] for report in self.ShardsReports)
+        self.ImagesPerSecond = len(image_paths) / (end - start)
+
+        return save_path
+
+    # Decodes every image once and derives the input of each model from the shared decoded image
+    def create_embeddings_multi(self, models, save_paths, batch_size=None):
+        self.ModelsCreationTimes = {model.Name: 0 for model in models}
+        self.ModelsPreprocessingTimes = {model.Name: 0 for model in models}
+
+        loader = ImageLoader(self.FacesPath, workers=self.LoaderWorkers, processes=self.LoaderProcesses)
+        batch_sizes = [batch_size if batch_size is not None else model.BatchSize for model in models]
+        images = [list() for _ in models]
+        image_paths = [list() for _ in models]
+
+        with ExitStack() as stack:
+            writers = [stack.enter_context(EmbeddingsStoreWriter(save_path.replace("\\", "/"), model.Name,
+                                                                 model.NormalizedOutput))
+                       for model, save_path in zip(models, save_paths)]
 
-        np.set_printoptions(threshold=sys.maxsize, precision=15)
-        with open(save_path, "w") as file:
             progress_bar = tqdm(loader.next_image(), total=loader.get_total_images_number(),
-                                desc=model.Name, leave=True)
+                                desc=", ".join(model.Name for model in models), leave=True)
 
             for image, image_path in progress_bar:
-                start = default_timer()
-                result = model.predict(image)
-                end = default_timer()
+                for idx, model in enumerate(models):
+                    processed, resize_time, preprocessing_time = prepare_image(image, model.InputSize,
+                                                                               model.preprocess_input)
+                    self.ModelsPreprocessingTimes[model.Name] += resize_time + preprocessing_time
 
-                self.EmbeddingsCreationTime += (end - start)
+                    images[idx].append(processed)
+                    image_paths[idx].append(image_path)
 
-                embedding = array_str(result[0, :], precision=15)
-                embedding = embedding.replace("\n", "")
-                embedding = embedding.replace("[", "")
-                embedding = embedding.replace("]", "")
+                    if len(images[idx]) == batch_sizes[idx]:
+                        self.predict_model_batch(model, images[idx], image_paths[idx], writers[idx])
 
-                result_string = f"{image_path}\t{embedding}\n"
-                file.write(result_string)
+                        images[idx] = list()
+                        image_paths[idx] = list()
 
-        self.ImagePreprocessingTime = loader.ImagePreprocessingTime + loader.ImageResizeTime
+            for idx, model in enumerate(models):
+                if images[idx]:
+                    self.predict_model_batch(model, images[idx], image_paths[idx], writers[idx])
+
+    def predict_model_batch(self, model, images, image_paths, writer):
+        start = default_timer()
+        result = model.predict_batch(images)
+        end = default_timer()
+
+        self.ModelsCreationTimes[model.Name] += (end - start)
+
+        writer.write_batch(image_paths, result)
+
+    @staticmethod
+    def write_ready(pending, writer):
+        while pending and pending[0][1] is not None:
+            image_path, embedding = pending.popleft()
+            writer.write(image_path, embedding)
+
+
+def set_thread_budget(intra_op_threads, inter_op_threads=1):
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+
+    import tensorflow as tf
+    from keras import backend as K
+
+    config = tf.compat.v1.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                                      inter_op_parallelism_threads=inter_op_threads)
+    K.set_session(tf.compat.v1.Session(config=config))
+
+
+# Model kwargs may select an inference backend for the model with "backend" and its settings with "backend_params"
+def construct_model(model_constructor, kwargs, models_cache=None):
+    kwargs = dict(kwargs)
+    backend = kwargs.pop("backend", None)
+    backend_params = kwargs.pop("backend_params", dict())
+
+    if models_cache is None:
+        model = model_constructor(**kwargs)
+    else:
+        model = model_constructor(**kwargs, models_cache=models_cache)
+
+    if backend is not None:
+        model.set_inference_backend(backend, models_cache, **backend_params)
+
+    return model
+
+
+# Runs in a worker process of the sharded mode. Utilisation is the share of the worker time after model
+# construction, which was spent preprocessing images and predicting embeddings rather than waiting on reads.
+def create_embeddings_shard(faces_path, model_constructor, kwargs, models_cache, intra_op_threads, batch_size,
+                            loader_workers, resume, shard):
+    shard_path, image_paths = shard
+
+    start = default_timer()
+    set_thread_budget(intra_op_threads)
+    model = construct_model(model_constructor, kwargs, models_cache)
+    init_end = default_timer()
+
+    embeddings_creator = ImageEmbeddingsCreator(faces_path, loader_workers)
+    embeddings_creator.create_embeddings(model, shard_path, batch_size, image_paths=image_paths, progress=False,
+                                         resume=resume)
+    end = default_timer()
+
+    busy_time = embeddings_creator.EmbeddingsCreationTime + embeddings_creator.ImagePreprocessingTime
+
+    return {"shard": shard_path, "model": model.Name, "images": len(image_paths), "init_time": init_end - start,
+            "creation_time": embeddings_creator.EmbeddingsCreationTime,
+            "preprocessing_time": embeddings_creator.ImagePreprocessingTime,
+            "wall_time": end - init_end, "utilisation": busy_time / max(end - init_end, 1e-9)}
@@ -0,0 +1,278 @@
+import os
+import json
+import zlib
+import struct
+
+import numpy as np
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+PATHS_FILE = "paths.txt"
+MANIFEST_FILE = "manifest.json"
+
+DEFAULT_CHUNK_SIZE = 1024
+
+FOOTER_MAGIC = b"FCEMBEND"
+FOOTER_FORMAT = "<8sQII"
+FOOTER_SIZE = struct.calcsize(FOOTER_FORMAT)
+
+
+# Embeddings store is a directory holding a contiguous float32 matrix of embeddings, which can be memory-mapped,
+# a table of image paths with one path per line in the same order, and a small header describing the matrix.
+# Embeddings are written in chunks, each chunk along with its paths, so that an interrupted store only holds
+# complete chunks. The matrix is followed by a footer with the number of rows, the dimension and a CRC32
+# of the matrix, which is only written once the store is complete.
+# Every flushed chunk is checkpointed in a manifest with the number of rows and the CRC32 written so far. A resumed
+# writer truncates the store to its last checkpoint, or to its end if it is complete, verifies the checksum and
+# appends to it, with the paths already written in CompletedPaths.
+class EmbeddingsStoreWriter:
+
+    def __init__(self, store_path, model_name, normalized=False, chunk_size=DEFAULT_CHUNK_SIZE, resume=False):
+        self.StorePath = store_path.replace("\\", "/")
+        self.ModelName = model_name
+        self.Normalized = normalized
+        self.ChunkSize = chunk_size
+        self.Dimension = None
+        self.Count = 0
+        self.Checksum = 0
+
+        self.Buffer = None
+        self.BufferedPaths = list()
+        self.CompletedPaths = list()
+
+        if not os.path.exists(self.StorePath):
+            os.mkdir(self.StorePath)
+
+        mode = "w"
+        if resume:
+            checkpoint = load_embeddings_checkpoint(self.StorePath)
+
+            if checkpoint is not None:
+                self.restore_checkpoint(checkpoint)
+                mode = "a"
+
+        # A store being rewritten is incomplete until the writer is closed, and starts from an empty checkpoint,
+        # so that a rewrite killed before its first chunk is not resumed from the checkpoint of a previous run
+        if mode == "w":
+            if os.path.isfile(f"{self.StorePath}/{HEADER_FILE}"):
+                os.remove(f"{self.StorePath}/{HEADER_FILE}")
+
+            self.write_checkpoint()
+
+        self.VectorsFile = open(f"{self.StorePath}/{VECTORS_FILE}", mode + "b")
+        self.PathsFile = open(f"{self.StorePath}/{PATHS_FILE}", mode)
+
+    def restore_checkpoint(self, checkpoint):
+        if checkpoint["model"] != self.ModelName:
+            raise ValueError(f"Embeddings store {self.StorePath} was created by model {checkpoint['model']}")
+
+        self.Dimension = checkpoint["dimension"] or None
+        self.Count = checkpoint["count"]
+        self.Checksum = checkpoint["checksum"]
+
+        if self.Dimension is not None:
+            self.Buffer = np.empty((self.ChunkSize, self.Dimension), dtype="float32")
+
+        vectors_path = f"{self.StorePath}/{VECTORS_FILE}"
+        vectors_size = self.Count * (self.Dimension or 0) * np.dtype("float32").itemsize
+
+        if os.path.getsize(vectors_path) < vectors_size:
+            raise ValueError(f"Embeddings store {self.StorePath} is shorter than its checkpoint")
+
+        # Rows written after the last checkpoint and the footer of a complete store are dropped
+        with open(vectors_path, "r+b") as file:
+            file.truncate(vectors_size)
+
+            checksum = 0
+            for block in iter(lambda: file.read(2 ** 20), b""):
+                checksum = zlib.crc32(block, checksum)
+
+        if checksum != self.Checksum:
+            raise ValueError(f"Embeddings store {self.StorePath} is corrupted")
+
+        with open(f"{self.StorePath}/{PATHS_FILE}", "r") as file:
+            paths = file.read().splitlines()
+
+        if len(paths) < self.Count:
+            raise ValueError(f"Embeddings store {self.StorePath} has fewer paths than its checkpoint")
+
+        self.CompletedPaths = paths[:self.Count]
+        with open(f"{self.StorePath}/{PATHS_FILE}", "w") as file:
+            file.write("".join(f"{image_path}\n" for image_path in self.CompletedPaths))
+
+        # The store is incomplete again until the writer is closed
+        if os.path.isfile(f"{self.StorePath}/{HEADER_FILE}"):
+            os.remove(f"{self.StorePath}/{HEADER_FILE}")
+
+    def write(self, image_path, embedding):
+        self.write_batch([image_path], np.reshape(embedding, (1, -1)))
+
+    def write_batch(self, image_paths, embeddings):
+        image_paths = list(image_paths)
+        embeddings = np.asarray(embeddings, dtype="float32")
+
+        if self.Dimension is None:
+            self.Dimension = embeddings.shape[1]
+            self.Buffer = np.empty((self.ChunkSize, self.Dimension), dtype="float32")
+        elif embeddings.shape[1] != self.Dimension:
+            raise ValueError(f"Expected embeddings of dimension {self.Dimension}, got {embeddings.shape[1]}")
+
+        position = 0
+        while position < len(embeddings):
+            buffered = len(self.BufferedPaths)
+            size = min(self.ChunkSize - buffered, len(embeddings) - position)
+
+            self.Buffer[buffered:buffered + size] = embeddings[position:position + size]
+            self.BufferedPaths.extend(image_paths[position:position + size])
+            position += size
+
+            if len(self.BufferedPaths) == self.ChunkSize:
+                self.flush()
+
+    def flush(self):
+        if not self.BufferedPaths:
+            return
+
+        chunk = memoryview(self.Buffer[:len(self.BufferedPaths)])
+        self.Checksum = zlib.crc32(chunk, self.Checksum)
+
+        self.VectorsFile.write(chunk)
+        self.PathsFile.write("".join(f"{image_path}\n" for image_path in self.BufferedPaths))
+        self.VectorsFile.flush()
+        self.PathsFile.flush()
+
+        self.Count += len(self.BufferedPaths)
+        self.BufferedPaths = list()
+
+        self.write_checkpoint()
+
+    # The manifest is replaced only after both files are flushed, so it never covers rows missing from them
+    def write_checkpoint(self):
+        checkpoint = {"model": self.ModelName, "dimension": self.Dimension or 0, "count": self.Count,
+                      "checksum": self.Checksum}
+        manifest_path = f"{self.StorePath}/{MANIFEST_FILE}"
+
+        with open(f"{manifest_path}.partial", "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(f"{manifest_path}.partial", manifest_path)
+
+    # The footer and the header mark the store as complete, so a writer closed with complete=False, such as one
+    # interrupted by an exception, only checkpoints its buffered rows and leaves the store to be resumed
+    def close(self, complete=True):
+        self.flush()
+
+        if not complete:
+            self.VectorsFile.close()
+            self.PathsFile.close()
+            return
+
+        self.VectorsFile.write(struct.pack(FOOTER_FORMAT, FOOTER_MAGIC, self.Count, self.Dimension or 0,
+                                           self.Checksum))
+
+        self.VectorsFile.close()
+        self.PathsFile.close()
+
+        header = {"model": self.ModelName, "dimension": self.Dimension or 0, "count": self.Count,
+                  "dtype": "float32", "normalized": self.Normalized, "checksum": self.Checksum}
+
+        with open(f"{self.StorePath}/{HEADER_FILE}", "w") as file:
+            json.dump(header, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(complete=exc_type is None)
+
+
+def is_embeddings_store(path):
+    return os.path.isfile(f"{path}/{HEADER_FILE}")
+
+
+def load_embeddings_header(store_path):
+    with open(f"{store_path}/{HEADER_FILE}", "r") as file:
+        return json.load(file)
+
+
+# Checkpoint of an interrupted store, or the header of a complete one, which holds the same fields
+def load_embeddings_checkpoint(store_path):
+    for checkpoint_file in (HEADER_FILE, MANIFEST_FILE):
+        checkpoint_path = f"{store_path}/{checkpoint_file}"
+
+        if os.path.isfile(checkpoint_path):
+            with open(checkpoint_path, "r") as file:
+                return json.load(file)
+
+    return None
+
+
+def read_embeddings_footer(store_path, header):
+    offset = header["count"] * header["dimension"] * np.dtype(header["dtype"]).itemsize
+
+    with open(f"{store_path}/{VECTORS_FILE}", "rb") as file:
+        file.seek(offset)
+        footer = file.read(FOOTER_SIZE)
+
+    if len(footer) != FOOTER_SIZE:
+        return None
+
+    magic, count, dimension, checksum = struct.unpack(FOOTER_FORMAT, footer)
+    if magic != FOOTER_MAGIC or count != header["count"] or dimension != header["dimension"]:
+        return None
+
+    return checksum
+
+
+def load_embeddings_store(store_path, mmap=True, verify=False):
+    header = load_embeddings_header(store_path)
+    shape = (header["count"], header["dimension"])
+    vectors_path = f"{store_path}/{VECTORS_FILE}"
+
+    checksum = read_embeddings_footer(store_path, header)
+    if checksum is None:
+        raise ValueError(f"Embeddings store {store_path} is incomplete")
+
+    if header["count"] == 0:
+        vectors = np.empty(shape, dtype=header["dtype"])
+    elif mmap:
+        vectors = np.memmap(vectors_path, dtype=header["dtype"], mode="r", shape=shape)
+    else:
+        vectors = np.fromfile(vectors_path, dtype=header["dtype"], count=shape[0] * shape[1]).reshape(shape)
+
+    if verify and zlib.crc32(memoryview(np.ascontiguousarray(vectors)).cast("B")) != checksum:
+        raise ValueError(f"Embeddings store {store_path} is corrupted")
+
+    with open(f"{store_path}/{PATHS_FILE}", "r") as file:
+        paths = file.read().splitlines()
+
+    return paths, vectors, header
+
+
+def save_embeddings_store(store_path, paths, vectors, model_name, normalized=False):
+    with EmbeddingsStoreWriter(store_path, model_name, normalized) as writer:
+        writer.write_batch(paths, vectors)
+
+
+# Concatenates complete stores of the same model in the given order into one store
+def merge_embeddings_stores(store_paths, save_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    header = load_embeddings_header(store_paths[0])
+
+    with EmbeddingsStoreWriter(save_path, header["model"], header["normalized"], chunk_size) as writer:
+        for store_path in store_paths:
+            paths, vectors, _ = load_embeddings_store(store_path, verify=True)
+
+            for start in range(0, len(paths), chunk_size):
+                writer.write_batch(paths[start:start + chunk_size], vectors[start:start + chunk_size])
+
+
+# Writes embeddings in the text format of "path\tvalues separated by spaces" lines
+def export_embeddings_text(store_path, text_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    paths, vectors, header = load_embeddings_store(store_path)
+    row_format = "%s\t" + " ".join(["%.9g"] * header["dimension"]) + "\n"
+
+    with open(text_path, "w") as file:
+        for start in range(0, len(paths), chunk_size):
+            rows = vectors[start:start + chunk_size].tolist()
+            chunk_paths = paths[start:start + chunk_size]
+
+            file.write("".join(row_format % (path, *row) for path, row in zip(chunk_paths, rows)))
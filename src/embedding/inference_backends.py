@@ -0,0 +1,232 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# Backends whose outputs only approximate the Keras ones, so that normalized outputs are no longer exactly unit-norm
+QUANTIZED_BACKENDS = ("tflite-int8",)
+
+
+# Frozen TensorFlow graph of a model, run in its own session. Variables are folded into constants and the graph is
+# optimized for inference, which folds batch normalization into the preceding convolutions and strips training only
+# nodes. It mirrors the predict method of Keras models, so it can replace the Keras model of an embedding model.
+class FrozenGraphModel:
+
+    def __init__(self, graph_def, input_name, output_name, intra_op_threads=0, inter_op_threads=0):
+        import tensorflow as tf
+
+        self.Graph = tf.Graph()
+        with self.Graph.as_default():
+            tf.compat.v1.import_graph_def(graph_def, name="")
+
+        config = tf.compat.v1.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                                          inter_op_parallelism_threads=inter_op_threads)
+        config.graph_options.optimizer_options.opt_level = tf.compat.v1.OptimizerOptions.L1
+        config.graph_options.optimizer_options.do_function_inlining = True
+
+        self.Session = tf.compat.v1.Session(graph=self.Graph, config=config)
+        self.Input = self.Graph.get_tensor_by_name(f"{input_name}:0")
+        self.Output = self.Graph.get_tensor_by_name(f"{output_name}:0")
+
+    def predict(self, x, batch_size=32):
+        outputs = [self.Session.run(self.Output, {self.Input: x[start:start + batch_size]})
+                   for start in range(0, len(x), batch_size)]
+
+        return np.concatenate(outputs, axis=0)
+
+
+# Builds the model once more in inference mode in a separate graph, so that the graph holds no learning phase
+# switches, and freezes it
+def export_frozen_graph(model):
+    import tensorflow as tf
+    from keras import backend as K
+    from tensorflow.python.tools import optimize_for_inference_lib
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.compat.v1.Session(graph=graph).as_default() as session:
+        K.set_learning_phase(0)
+        keras_model = model.build_model()
+
+        input_name = keras_model.inputs[0].op.name
+        output_name = keras_model.outputs[0].op.name
+
+        graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(session, graph.as_graph_def(),
+                                                                           [output_name])
+
+    graph_def = optimize_for_inference_lib.optimize_for_inference(graph_def, [input_name], [output_name],
+                                                                  tf.float32.as_datatype_enum)
+
+    return graph_def, input_name, output_name
+
+
+# Input and output node names of a cached frozen graph are stored next to it, as they can not be told reliably
+# from the graph itself
+def save_graph_endpoints(endpoints_path, input_name, output_name):
+    temp_path = f"{endpoints_path}.{os.getpid()}.partial"
+    with open(temp_path, "w") as file:
+        json.dump({"input": input_name, "output": output_name}, file)
+    os.replace(temp_path, endpoints_path)
+
+
+def load_graph_endpoints(endpoints_path):
+    with open(endpoints_path, "r") as file:
+        endpoints = json.load(file)
+
+    return endpoints["input"], endpoints["output"]
+
+
+def create_frozen_graph_model(model, models_cache=None, intra_op_threads=0, inter_op_threads=0):
+    import tensorflow as tf
+
+    graph_path = models_cache.get_model_path(model, suffix="pb") if models_cache is not None else None
+    endpoints_path = f"{graph_path}.json"
+
+    if graph_path is not None and os.path.isfile(graph_path) and os.path.isfile(endpoints_path):
+        graph_def = tf.compat.v1.GraphDef()
+        with open(graph_path, "rb") as file:
+            graph_def.ParseFromString(file.read())
+
+        input_name, output_name = load_graph_endpoints(endpoints_path)
+    else:
+        graph_def, input_name, output_name = export_frozen_graph(model)
+
+        # The endpoints are saved first, so that a cached graph always has them
+        if graph_path is not None:
+            save_graph_endpoints(endpoints_path, input_name, output_name)
+
+            temp_path = f"{graph_path}.{os.getpid()}.partial"
+            with open(temp_path, "wb") as file:
+                file.write(graph_def.SerializeToString())
+            os.replace(temp_path, graph_path)
+
+    return FrozenGraphModel(graph_def, input_name, output_name, intra_op_threads, inter_op_threads)
+
+
+# TensorFlow Lite model, run by the TensorFlow Lite interpreter, which mirrors the predict method of Keras models
+class TFLiteModel:
+
+    def __init__(self, model_content, num_threads=None):
+        import tensorflow as tf
+
+        self.Interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=num_threads)
+        self.InputIndex = self.Interpreter.get_input_details()[0]["index"]
+        self.OutputIndex = self.Interpreter.get_output_details()[0]["index"]
+        self.InputBatchSize = None
+
+    def predict(self, x, batch_size=32):
+        outputs = list()
+
+        for start in range(0, len(x), batch_size):
+            batch = np.asarray(x[start:start + batch_size], dtype="float32")
+
+            if len(batch) != self.InputBatchSize:
+                self.Interpreter.resize_tensor_input(self.InputIndex, batch.shape)
+                self.Interpreter.allocate_tensors()
+                self.InputBatchSize = len(batch)
+
+            self.Interpreter.set_tensor(self.InputIndex, batch)
+            self.Interpreter.invoke()
+            outputs.append(self.Interpreter.get_tensor(self.OutputIndex).copy())
+
+        return np.concatenate(outputs, axis=0)
+
+
+def load_images_sample(faces_path, model, sample_size):
+    from src.image_processing.image_loader import ImageLoader
+
+    loader = ImageLoader(faces_path, preproc_func=model.preprocess_input, target_size=model.InputSize)
+    images = list()
+
+    for image, _ in loader.next_image():
+        images.append(image)
+
+        if len(images) == sample_size:
+            break
+
+    if not images:
+        raise ValueError(f"No images to sample in {faces_path}")
+
+    return np.concatenate(images, axis=0)
+
+
+# The calibration sample is the first calibration_size images of calibration_path, as read by load_images_sample.
+# Their content hashes are sorted, as the calibrated ranges do not depend on the order of the images.
+def hash_calibration_sample(calibration_path, calibration_size):
+    from src.embedding.embeddings_cache import hash_file
+    from src.image_processing.image_loader import ImageLoader
+
+    images_hashes = sorted(hash_file(image_path)
+                           for image_path in ImageLoader(calibration_path).ImagesList[:calibration_size])
+
+    return hashlib.sha1("|".join(images_hashes).encode()).hexdigest()
+
+
+# Post-training quantization of weights and activations to int8. Activation ranges are calibrated on a sample of
+# face crops, which should come from the same extraction and normalization as the faces to embed.
+def export_int8_model(model, calibration_path, calibration_size):
+    import tensorflow as tf
+    from keras import backend as K
+
+    calibration_images = load_images_sample(calibration_path, model, calibration_size)
+
+    def representative_dataset():
+        for image in calibration_images:
+            yield [image[np.newaxis]]
+
+    graph = tf.Graph()
+    with graph.as_default(), tf.compat.v1.Session(graph=graph).as_default() as session:
+        K.set_learning_phase(0)
+        keras_model = model.build_model()
+
+        converter = tf.compat.v1.lite.TFLiteConverter.from_session(session, keras_model.inputs, keras_model.outputs)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+
+        return converter.convert()
+
+
+def create_int8_model(model, models_cache=None, calibration_path=None, calibration_size=100, num_threads=None):
+    if calibration_path is None:
+        raise ValueError("Int8 quantization needs a calibration_path with a sample of face crops")
+
+    model_path = None
+    if models_cache is not None:
+        sample_hash = hash_calibration_sample(calibration_path, calibration_size)
+        model_path = models_cache.get_model_path(model, suffix=f"int8_{calibration_size}_{sample_hash}.tflite")
+
+    if model_path is not None and os.path.isfile(model_path):
+        with open(model_path, "rb") as file:
+            model_content = file.read()
+    else:
+        model_content = export_int8_model(model, calibration_path, calibration_size)
+
+        if model_path is not None:
+            temp_path = f"{model_path}.{os.getpid()}.partial"
+            with open(temp_path, "wb") as file:
+                file.write(model_content)
+            os.replace(temp_path, model_path)
+
+    return TFLiteModel(model_content, num_threads)
+
+
+# Key of the outputs of a backend, which covers the settings that change them: the calibration sample of
+# a quantized backend, but not its threads
+def get_inference_backend_key(backend, calibration_path=None, calibration_size=100, **backend_params):
+    if backend not in QUANTIZED_BACKENDS:
+        return backend
+
+    return f"{backend}|{calibration_size}|{hash_calibration_sample(calibration_path, calibration_size)}"
+
+
+INFERENCE_BACKENDS = {
+    "frozen-graph": create_frozen_graph_model,
+    "tflite-int8": create_int8_model
+}
+
+
+def create_inference_model(model, backend, models_cache=None, **backend_params):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of: {', '.join(INFERENCE_BACKENDS)}")
+
+    return INFERENCE_BACKENDS[backend](model, models_cache, **backend_params)
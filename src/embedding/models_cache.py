@@ -0,0 +1,61 @@
+import os
+import hashlib
+
+from src.embedding.embeddings_cache import hash_file
+
+
+# Cache of fully built models with loaded weights, keyed by the model class and its weights file hash. A cached model
+# is a single file holding both the architecture and the weights, so loading it skips building the graph in Python,
+# loading the weights separately and any download of pretrained weights.
+class ModelsCache:
+    DefaultCachePath = "./models/cache"
+
+    def __init__(self, cache_path=DefaultCachePath):
+        self.CachePath = cache_path.replace("\\", "/")
+        self.WeightsHashes = dict()
+
+        self.Hits = 0
+        self.Misses = 0
+
+        if not os.path.exists(self.CachePath):
+            os.makedirs(self.CachePath)
+
+    def get_model_key(self, model):
+        weights_path = model.WeightsPath
+
+        if weights_path is None or not os.path.isfile(weights_path):
+            raise FileNotFoundError(f"No local weights for model {model.Name} at {weights_path}, "
+                                    f"cached models are only built from local weights")
+
+        if weights_path not in self.WeightsHashes:
+            self.WeightsHashes[weights_path] = hash_file(weights_path)
+
+        model_class = f"{type(model).__module__}.{type(model).__qualname__}"
+
+        return hashlib.sha1(f"{model_class}|{self.WeightsHashes[weights_path]}".encode()).hexdigest()
+
+    def get_model_path(self, model, suffix="h5"):
+        return f"{self.CachePath}/{type(model).__qualname__}_{self.get_model_key(model)}.{suffix}"
+
+    def load(self, model, build_func):
+        from keras.models import load_model
+
+        model_path = self.get_model_path(model)
+
+        if os.path.isfile(model_path):
+            self.Hits += 1
+            return load_model(model_path, custom_objects=model.get_custom_objects(), compile=False)
+
+        self.Misses += 1
+        keras_model = build_func()
+
+        # Saving to a temporary file first, so that an interrupted save never leaves a broken cached model. The file
+        # is named after the process, as shard workers starting on a cold cache all build and save the same model.
+        temp_path = f"{model_path}.{os.getpid()}.partial.h5"
+        keras_model.save(temp_path, include_optimizer=False)
+        os.replace(temp_path, model_path)
+
+        return keras_model
+
+    def get_stats_report(self):
+        return f"Models cache: {self.Hits} hits, {self.Misses} misses"
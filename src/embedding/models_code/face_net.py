@@ -21,10 +21,10 @@ class FaceNet(AbstractEmbeddingModel):
     InputSize = (160, 160)
     InputShape = (160, 160, 3)
 
-    def __init__(self, weights_path, name="FaceNet"):
+    def __init__(self, weights_path, name="FaceNet", models_cache=None):
         self.Name = name
-        self.Model = self.create_model()
-        self.Model.load_weights(weights_path)
+        self.WeightsPath = weights_path
+        self.Model = self.load_model(self.build_model, models_cache)
 
     @staticmethod
     def preprocess_input(image):
@@ -39,7 +39,17 @@ class FaceNet(AbstractEmbeddingModel):
         return samples
 
     def predict(self, x):
-        return self.Model.predict(x)
+        return self.Model.predict(x, batch_size=self.BatchSize)
+
+    @staticmethod
+    def get_custom_objects():
+        return {"scaling": scaling, "K": K}
+
+    def build_model(self):
+        model = self.create_model()
+        model.load_weights(self.WeightsPath)
+
+        return model
 
     def create_model(self):
         inputs = Input(shape=self.InputShape)
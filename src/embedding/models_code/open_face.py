@@ -16,11 +16,12 @@ import numpy as np
 class OpenFace(AbstractEmbeddingModel):
     InputSize = (96, 96)
     InputShape = (96, 96, 3)
+    NormalizedOutput = True
 
-    def __init__(self, weights_path, name="OpenFace"):
+    def __init__(self, weights_path, name="OpenFace", models_cache=None):
         self.Name = name
-        self.Model = self.create_model()
-        self.Model.load_weights(weights_path)
+        self.WeightsPath = weights_path
+        self.Model = self.load_model(self.build_model, models_cache)
 
     @staticmethod
     def preprocess_input(image):
@@ -34,7 +35,17 @@ class OpenFace(AbstractEmbeddingModel):
         return samples
 
     def predict(self, x):
-        return self.Model.predict(x)
+        return self.Model.predict(x, batch_size=self.BatchSize)
+
+    @staticmethod
+    def get_custom_objects():
+        return {"tf": tf, "K": K}
+
+    def build_model(self):
+        model = self.create_model()
+        model.load_weights(self.WeightsPath)
+
+        return model
 
     def create_model(self):
         inputs = Input(shape=(96, 96, 3))
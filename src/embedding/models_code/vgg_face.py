@@ -2,16 +2,22 @@ from keras_vggface import VGGFace
 from keras.applications.imagenet_utils import preprocess_input as imagenet_preprocess_input
 from src.embedding.embeddings_creation import AbstractEmbeddingModel
 
+import os
 import numpy as np
 
+# Local copy of the pretrained weights, where keras_vggface stores them after the first download
+VGG_FACE_WEIGHTS_DIR = os.path.expanduser("~/.keras/models/vggface")
+
 
 class FaceVGG(AbstractEmbeddingModel):
     InputSize = (224, 224)
     InputShape = (224, 224, 3)
 
-    def __init__(self, model, name="VGG-Face"):
+    def __init__(self, model, name="VGG-Face", models_cache=None):
         self.Name = name
-        self.Model = VGGFace(include_top=False, model=model, input_shape=self.InputShape, pooling='avg')
+        self.ModelType = model
+        self.WeightsPath = f"{VGG_FACE_WEIGHTS_DIR}/rcmalli_vggface_tf_notop_{model}.h5"
+        self.Model = self.load_model(self.build_model, models_cache)
 
     @staticmethod
     def preprocess_input(image):
@@ -21,19 +27,22 @@ class FaceVGG(AbstractEmbeddingModel):
         return image
 
     def predict(self, x):
-        return self.Model.predict(x)
+        return self.Model.predict(x, batch_size=self.BatchSize)
+
+    def build_model(self):
+        return VGGFace(include_top=False, model=self.ModelType, input_shape=self.InputShape, pooling='avg')
 
 
 class FaceVGG16(FaceVGG):
-    def __init__(self):
-        super(FaceVGG16, self).__init__(model="vgg16", name="VGG16")
+    def __init__(self, models_cache=None):
+        super(FaceVGG16, self).__init__(model="vgg16", name="VGG16", models_cache=models_cache)
 
 
 class FaceVGGResNet(FaceVGG):
-    def __init__(self):
-        super(FaceVGGResNet, self).__init__(model="resnet50", name="ResNetVGG")
+    def __init__(self, models_cache=None):
+        super(FaceVGGResNet, self).__init__(model="resnet50", name="ResNetVGG", models_cache=models_cache)
 
 
 class FaceVGGSqueezeNet(FaceVGG):
-    def __init__(self):
-        super(FaceVGGSqueezeNet, self).__init__(model="senet50", name="SqueezeNetVGG")
\ No newline at end of file
+    def __init__(self, models_cache=None):
+        super(FaceVGGSqueezeNet, self).__init__(model="senet50", name="SqueezeNetVGG", models_cache=models_cache)
\ No newline at end of file
@@ -0,0 +1,270 @@
+import os
+import re
+import hashlib
+
+import numpy as np
+
+from src.embedding.embeddings_cache import hash_file
+
+DEFAULT_FLUSH_INTERVAL = 1000
+COMPACTION_SEGMENTS = 16
+LANDMARKS_SHAPE = (68, 2)
+SEGMENT_PATTERN = re.compile(r"segment_(\d+)\.npz")
+
+
+# Detections are stored in columns: image hashes with offsets of their faces, and per face boxes, keypoints,
+# confidences and optional full landmarks. Faces without landmarks have a landmarks row of -1, so that only
+# the present landmarks take space. The path of the landmarks predictor is the same for all the faces of a detector.
+def encode_detections(detections):
+    faces = [face for image_faces in detections.values() for face in image_faces]
+
+    keypoints = next((face["keypoints"] for face in faces if "keypoints" in face), dict())
+    keypoint_names = list(keypoints)
+
+    face_offsets = np.cumsum([0] + [len(image_faces) for image_faces in detections.values()])
+    boxes = np.array([face["box"] for face in faces], dtype="int32").reshape(len(faces), 4)
+    keypoints = np.array([[face["keypoints"][name] for name in keypoint_names] for face in faces],
+                         dtype="int32").reshape(len(faces), len(keypoint_names), 2)
+    confidences = np.array([face.get("confidence", np.nan) for face in faces], dtype="float32")
+
+    has_landmarks = np.array(["landmarks" in face for face in faces], dtype=bool)
+    landmark_rows = np.where(has_landmarks, np.cumsum(has_landmarks) - 1, -1).astype("int32")
+    landmarks = np.array([face["landmarks"] for face in faces if "landmarks" in face],
+                         dtype="float32").reshape(int(has_landmarks.sum()), *LANDMARKS_SHAPE)
+    landmarks_predictor = next((face["landmarks_predictor"] for face in faces if "landmarks_predictor" in face), "")
+
+    return {"image_hashes": np.array(list(detections), dtype="S40"), "face_offsets": face_offsets, "boxes": boxes,
+            "keypoints": keypoints, "confidences": confidences, "landmark_rows": landmark_rows,
+            "landmarks": landmarks, "keypoint_names": np.array(keypoint_names, dtype="U16"),
+            "landmarks_predictor": np.array(landmarks_predictor)}
+
+
+def decode_faces(segment, row):
+    keypoint_names = segment["keypoint_names"].tolist()
+    landmarks_predictor = segment.get("landmarks_predictor", np.array("")).item()
+    faces = list()
+
+    for idx in range(segment["face_offsets"][row], segment["face_offsets"][row + 1]):
+        face = dict()
+        face.update({"box": tuple(int(value) for value in segment["boxes"][idx])})
+        face.update({"keypoints": {name: segment["keypoints"][idx, k] for k, name in enumerate(keypoint_names)}})
+
+        if not np.isnan(segment["confidences"][idx]):
+            face.update({"confidence": float(segment["confidences"][idx])})
+
+        if segment["landmark_rows"][idx] >= 0:
+            face.update({"landmarks": segment["landmarks"][segment["landmark_rows"][idx]]})
+
+            if landmarks_predictor:
+                face.update({"landmarks_predictor": landmarks_predictor})
+
+        faces.append(face)
+
+    return faces
+
+
+# Concatenates the columns of segments, shifting their face offsets and landmarks rows. Segments without faces
+# carry no keypoint names, all the other segments of a detector have the same ones.
+def merge_segments(segments):
+    keypoint_names = next((segment["keypoint_names"] for segment in segments if len(segment["boxes"]) > 0),
+                          np.array(list(), dtype="U16"))
+    landmarks_predictor = next((segment["landmarks_predictor"] for segment in segments
+                                if segment.get("landmarks_predictor", np.array("")).item()), np.array(""))
+
+    face_offsets = [np.zeros(1, dtype="int64")]
+    keypoints = list()
+    landmark_rows = list()
+    faces_num = 0
+    landmarks_num = 0
+
+    for segment in segments:
+        segment_faces = len(segment["boxes"])
+
+        if segment_faces > 0 and segment["keypoint_names"].tolist() != keypoint_names.tolist():
+            raise ValueError(f"Segments with different keypoints {segment['keypoint_names'].tolist()} "
+                             f"and {keypoint_names.tolist()} can not be merged")
+
+        face_offsets.append(segment["face_offsets"][1:] + faces_num)
+        keypoints.append(segment["keypoints"].reshape(segment_faces, len(keypoint_names), 2))
+        landmark_rows.append(np.where(segment["landmark_rows"] >= 0, segment["landmark_rows"] + landmarks_num, -1))
+
+        faces_num += segment_faces
+        landmarks_num += len(segment["landmarks"])
+
+    merged = {name: np.concatenate([segment[name] for segment in segments])
+              for name in ("image_hashes", "boxes", "confidences", "landmarks")}
+    merged.update({"face_offsets": np.concatenate(face_offsets), "keypoints": np.concatenate(keypoints),
+                   "landmark_rows": np.concatenate(landmark_rows).astype("int32"), "keypoint_names": keypoint_names,
+                   "landmarks_predictor": landmarks_predictor})
+
+    return merged
+
+
+# Detections of a single detector configuration, in a directory of append-only segment files. Every flush writes
+# only the new detections to a new segment, and segments are merged into one by compact, which also runs when
+# a table with more than COMPACTION_SEGMENTS segments is opened. A later segment takes precedence over
+# an earlier one, so an interrupted compaction leaves duplicates rather than lost detections.
+class DetectionsTable:
+
+    def __init__(self, table_path):
+        self.TablePath = table_path
+        self.Segments = list()
+        self.SegmentNumbers = list()
+        self.Index = dict()
+        self.NewDetections = dict()
+
+        if not os.path.exists(self.TablePath):
+            os.makedirs(self.TablePath)
+
+        for number in self.get_segment_numbers():
+            with np.load(self.get_segment_path(number)) as segment:
+                self.add_segment(number, {name: segment[name] for name in segment.files})
+
+        if len(self.Segments) > COMPACTION_SEGMENTS:
+            self.compact()
+
+    def get_segment_numbers(self):
+        matches = (SEGMENT_PATTERN.fullmatch(name) for name in os.listdir(self.TablePath))
+
+        return sorted(int(match.group(1)) for match in matches if match is not None)
+
+    def get_segment_path(self, number):
+        return f"{self.TablePath}/segment_{number:06d}.npz"
+
+    def add_segment(self, number, segment):
+        segment_idx = len(self.Segments)
+
+        self.Segments.append(segment)
+        self.SegmentNumbers.append(number)
+        self.Index.update({image_hash: (segment_idx, row)
+                           for row, image_hash in enumerate(segment["image_hashes"].tolist())})
+
+    # Writing to a temporary file first, so that an interrupted write never leaves a broken segment
+    def write_segment(self, segment):
+        number = self.SegmentNumbers[-1] + 1 if self.SegmentNumbers else 0
+        segment_path = self.get_segment_path(number)
+
+        temp_path = f"{segment_path}.partial.npz"
+        np.savez_compressed(temp_path, **segment)
+        os.replace(temp_path, segment_path)
+
+        return number
+
+    def lookup(self, image_hash):
+        image_hash = image_hash.encode()
+
+        if image_hash in self.NewDetections:
+            return self.NewDetections[image_hash]
+
+        location = self.Index.get(image_hash)
+        if location is None:
+            return None
+
+        segment_idx, row = location
+        return decode_faces(self.Segments[segment_idx], row)
+
+    def store(self, image_hash, faces):
+        self.NewDetections[image_hash.encode()] = faces
+
+    def flush(self):
+        if not self.NewDetections:
+            return
+
+        segment = encode_detections(self.NewDetections)
+        self.add_segment(self.write_segment(segment), segment)
+        self.NewDetections = dict()
+
+    def compact(self):
+        self.flush()
+
+        if len(self.Segments) <= 1:
+            return
+
+        segment = merge_segments(self.Segments)
+        number = self.write_segment(segment)
+
+        for old_number in self.SegmentNumbers:
+            os.remove(self.get_segment_path(old_number))
+
+        self.Segments = list()
+        self.SegmentNumbers = list()
+        self.Index = dict()
+        self.add_segment(number, segment)
+
+
+# Persistent cache of raw detector outputs keyed by image content hash and detector configuration, so that
+# extractions, re-alignments and experiments on the same images do not run the detector again
+class DetectionCache:
+    DefaultCachePath = "./results/extraction/detections"
+
+    def __init__(self, cache_path=DefaultCachePath, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.CachePath = cache_path.replace("\\", "/")
+        self.FlushInterval = flush_interval
+        self.Tables = dict()
+        self.ImageHashes = dict()
+        self.NewDetectionsNumber = 0
+
+        self.Hits = 0
+        self.Misses = 0
+
+        if not os.path.exists(self.CachePath):
+            os.makedirs(self.CachePath)
+
+    @staticmethod
+    def get_detector_key(extractor):
+        detector = f"{type(extractor).__module__}.{type(extractor).__qualname__}|{extractor.Name}|" \
+                   f"{extractor.get_detection_config()}"
+
+        return hashlib.sha1(detector.encode()).hexdigest()
+
+    def get_table(self, extractor):
+        detector_key = self.get_detector_key(extractor)
+
+        if detector_key not in self.Tables:
+            table_path = f"{self.CachePath}/{type(extractor).__qualname__}_{detector_key}"
+            self.Tables[detector_key] = DetectionsTable(table_path)
+
+        return self.Tables[detector_key]
+
+    def lookup(self, extractor, image_path):
+        image_hash = hash_file(image_path)
+        faces = self.get_table(extractor).lookup(image_hash)
+
+        if faces is None:
+            self.Misses += 1
+            self.ImageHashes[image_path] = image_hash
+        else:
+            self.Hits += 1
+
+        return faces
+
+    def store(self, extractor, image_path, faces):
+        image_hash = self.ImageHashes.pop(image_path, None) or hash_file(image_path)
+        self.get_table(extractor).store(image_hash, faces)
+
+        self.NewDetectionsNumber += 1
+        if self.NewDetectionsNumber % self.FlushInterval == 0:
+            self.flush()
+
+    def flush(self):
+        for table in self.Tables.values():
+            table.flush()
+
+    def compact(self):
+        for table in self.Tables.values():
+            table.compact()
+
+    def get_stats_report(self):
+        total = self.Hits + self.Misses
+        hit_rate = self.Hits / total if total > 0 else 0
+
+        return f"Detection cache: {self.Hits} hits, {self.Misses} misses, hit rate {hit_rate:.2%}"
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,7 +1,8 @@
-from mtcnn import MTCNN
-
 from src.extraction.normalization_utils import LANDMARKS_PREDICTOR_PATH, RIGHT_EYE, LEFT_EYE, NOSE
+from src.image_processing.image_loader import load_image
 
+from multiprocessing import get_context
+from functools import partial
 from timeit import default_timer
 from abc import abstractmethod
 from tqdm import tqdm
@@ -12,66 +13,200 @@ import dlib
 import numpy as np
 
 
+EXTRACTION_CHUNK_SIZE = 4
+
+
+# Models in ModelAttributes can not be pickled, so an extractor sent to a worker process is pickled without them
+# and loads its own models with load_models, once per worker. The detection cache stays with the parent process.
 class FaceExtractor:
     Name = "Default Name"
     ExtractedFaces = 0
     NormalizationTime = 0
+    ModelAttributes = ()
+    DetectionCache = None
 
     def __init__(self, single_face=False):
         self.OnlyOneFace = single_face
 
-    def extract_faces(self, loader, save_path, aligner=None):
+    def load_models(self):
+        pass
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items()
+                if name not in self.ModelAttributes and name != "DetectionCache"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.load_models()
+
+    # With resume, images recorded in the manifest of a previous run, whose faces are all saved, are skipped.
+    # The manifest is checkpointed every checkpoint_interval images. With workers > 0 images are distributed
+    # to a pool of worker processes, each with its own copy of the extractor and the aligner. With a detection
+    # cache, detections of images seen before by the same detector configuration are loaded instead of detected.
+    def extract_faces(self, loader, save_path, aligner=None, resume=False, checkpoint_interval=100, workers=0,
+                      detection_cache=None):
         self.NormalizationTime = 0
         self.ExtractedFaces = 0
+        self.DetectionCache = detection_cache
+
+        save_path = self.create_save_path(save_path, aligner)
+
+        manifest_path = f"{save_path}.manifest"
+        completed = read_extraction_manifest(manifest_path, save_path) if resume else dict()
+        loader.ImagesList = [image_path for image_path in loader.ImagesList if image_path not in completed]
+
+        aligner_name = aligner.Name if aligner is not None else "no normalization"
+        if workers > 0:
+            extracted_images = self.extract_images_parallel(loader, save_path, aligner, workers)
+        else:
+            extracted_images = self.extract_images(loader, save_path, aligner)
+
+        progress_bar = tqdm(extracted_images, total=loader.get_total_images_number(),
+                            desc=f"Extracting faces for {self.Name} with {aligner_name}:", leave=True)
+
+        # The manifest is rewritten with the verified entries only, dropping a line torn by an interruption
+        with open(manifest_path, "w") as manifest:
+            manifest.write("".join(f"{image_path}\t{faces_num}\n" for image_path, faces_num in completed.items()))
+            checkpoint = list()
+
+            for image_path, faces_num in progress_bar:
+                checkpoint.append(f"{image_path}\t{faces_num}\n")
+
+                if len(checkpoint) == checkpoint_interval:
+                    manifest.write("".join(checkpoint))
+                    manifest.flush()
+                    checkpoint = list()
+
+            manifest.write("".join(checkpoint))
+
+    def extract_images(self, loader, save_path, aligner=None):
+        for image, image_path in loader.next_image():
+            yield image_path, self.extract_image_faces(image, image_path, save_path, aligner)
+
+    # Workers are spawned rather than forked, as the detectors may hold state which does not survive a fork.
+    # Cached detections are looked up before the pool starts and sent along with the images, while new detections
+    # are sent back by the workers and stored here, so that only this process reads and writes the cache.
+    def extract_images_parallel(self, loader, save_path, aligner, workers):
+        extract_image = partial(extract_image_in_worker, save_path, loader.ColorModeRGB)
+        tasks = [(image_path, self.lookup_detections(image_path)) for image_path in loader.ImagesList]
+
+        with get_context("spawn").Pool(processes=workers, initializer=init_extraction_worker,
+                                       initargs=(self, aligner)) as pool:
+            for image_path, faces_num, normalization_time, detections in pool.imap_unordered(extract_image, tasks,
+                                                                                             EXTRACTION_CHUNK_SIZE):
+                if detections is not None:
+                    self.store_detections(image_path, detections)
+
+                self.ExtractedFaces += faces_num
+                self.NormalizationTime += normalization_time
+
+                yield image_path, faces_num
+
+    # Detects faces of every image once and applies all the aligners to the same detections. Normalization time
+    # of every aligner is accumulated separately in NormalizationTimes, in the order of aligners.
+    def extract_faces_multi(self, loader, save_path, aligners, detection_cache=None):
+        self.NormalizationTimes = [0] * len(aligners)
+        self.DetectionTime = 0
+        self.ExtractedFaces = 0
+        self.DetectionCache = detection_cache
 
+        save_paths = [self.create_save_path(save_path, aligner) for aligner in aligners]
+
+        aligners_names = ", ".join(aligner.Name if aligner is not None else "no normalization" for aligner in aligners)
+        progress_bar = tqdm(loader.next_image(), total=loader.get_total_images_number(),
+                            desc=f"Extracting faces for {self.Name} with {aligners_names}:", leave=True)
+
+        for image, image_path in progress_bar:
+            start_time = default_timer()
+            faces = self.detect_faces(image, image_path)
+            end_time = default_timer()
+
+            self.DetectionTime += (end_time - start_time)
+            self.ExtractedFaces += len(faces)
+
+            for idx, (aligner, aligner_path) in enumerate(zip(aligners, save_paths)):
+                self.NormalizationTimes[idx] += self.save_faces(image, image_path, faces, aligner_path, aligner)
+
+    def create_save_path(self, save_path, aligner=None):
         save_path = save_path + "/" + self.Name
 
         if not os.path.exists(save_path):
             os.mkdir(save_path)
 
-        save_path = save_path + "/" + aligner.Name if aligner is not None else "No normalization"
+        save_path = save_path + "/" + (aligner.Name if aligner is not None else "No normalization")
 
         if not os.path.exists(save_path):
             os.mkdir(save_path)
 
-        aligner_name = aligner.Name if aligner is not None else "no normalization"
-        progress_bar = tqdm(loader.next_image(), total=loader.get_total_images_number(),
-                            desc=f"Extracting faces for {self.Name} with {aligner_name}:", leave=True)
+        return save_path
 
-        for image, image_path in progress_bar:
-            faces = self.get_bounding_boxes(image)
+    def extract_image_faces(self, image, image_path, save_path, aligner=None, detections=None):
+        faces = self.detect_faces(image, image_path, detections)
+
+        self.ExtractedFaces += len(faces)
+        self.NormalizationTime += self.save_faces(image, image_path, faces, save_path, aligner)
+
+        return len(faces)
+
+    # Raw detections are cached before the single face selection, so that both settings share the cached detections
+    def detect_faces(self, image, image_path=None, detections=None):
+        faces = detections if detections is not None else self.get_detections(image, image_path)
+
+        if self.OnlyOneFace:
+            if len(faces) > 0:
+                faces = [max(faces, key=lambda f: f["box"][2] * f["box"][3])]
+
+        return faces
+
+    def get_detections(self, image, image_path=None):
+        if image_path is None or self.DetectionCache is None:
+            return self.get_bounding_boxes(image)
+
+        detections = self.lookup_detections(image_path)
+
+        if detections is None:
+            detections = self.get_bounding_boxes(image)
+            self.store_detections(image_path, detections)
+
+        return detections
+
+    def lookup_detections(self, image_path):
+        return self.DetectionCache.lookup(self, image_path) if self.DetectionCache is not None else None
 
-            if self.OnlyOneFace:
-                if len(faces) > 0:
-                    faces = [max(faces, key=lambda f: f["box"][2] * f["box"][3])]
+    def store_detections(self, image_path, detections):
+        if self.DetectionCache is not None:
+            self.DetectionCache.store(self, image_path, detections)
 
-            sep_pos = image_path.rfind("/") + 1
-            dot_pos = image_path.rfind('.')
-            image_name = image_path[sep_pos:dot_pos].replace("\\", "/")
+    # Settings of the detector, which change its detections, and are a part of the detection cache key
+    def get_detection_config(self):
+        return ""
 
-            for idx, face in enumerate(faces):
-                self.ExtractedFaces += 1
+    # Saves normalized faces of an image and returns the time spent normalizing them
+    @staticmethod
+    def save_faces(image, image_path, faces, save_path, aligner=None):
+        normalization_time = 0
+        image_name = get_image_name(image_path)
 
-                if aligner is not None:
-                    start_time = default_timer()
-                    face_image = aligner.normalize_face(image, face)
-                    end_time = default_timer()
+        for idx, face in enumerate(faces):
+            if aligner is not None:
+                start_time = default_timer()
+                face_image = aligner.normalize_face(image, face)
+                end_time = default_timer()
 
-                    self.NormalizationTime += (end_time - start_time)
-                else:
-                    x1, y1, width, height = face["box"]
-                    x2 = x1 + width
-                    y2 = y1 + height
-                    face_image = image[y1:y2, x1:x2]
+                normalization_time += (end_time - start_time)
+            else:
+                x1, y1, width, height = face["box"]
+                x2 = x1 + width
+                y2 = y1 + height
+                face_image = image[y1:y2, x1:x2]
 
-                save_dir = save_path + "/" + image_name
-                if not os.path.exists(save_dir):
-                    os.mkdir(save_dir)
+            save_dir = save_path + "/" + image_name
+            if not os.path.exists(save_dir):
+                os.mkdir(save_dir)
 
-                face_name = f"{image_name}_face_{idx}.jpg"
-                face_path = save_dir + "/" + face_name
+            cv2.imwrite(get_face_path(save_path, image_path, idx), face_image)
 
-                cv2.imwrite(face_path, face_image)
+        return normalization_time
 
     @abstractmethod
     def get_bounding_boxes(self, image):
@@ -80,25 +215,45 @@ class FaceExtractor:
 
 class FaceExtractorMTCNN(FaceExtractor):
     Name = "MTCNN Face Extractor"
+    ModelAttributes = ("Detector",)
 
     def __init__(self, single_face=False):
         self.NormalizationTime = 0
-        self.Detector = MTCNN()
+        self.load_models()
         super().__init__(single_face)
 
+    def load_models(self):
+        from mtcnn import MTCNN
+
+        self.Detector = MTCNN()
+
     def get_bounding_boxes(self, image):
         return self.Detector.detect_faces(image)
 
 
 class FaceExtractorDlib(FaceExtractor):
     Name = "Dlib-based Face Extractor"
+    ModelAttributes = ("Detector", "LandmarksPredictor")
 
-    def __init__(self, landmarks_predictor_path=LANDMARKS_PREDICTOR_PATH, single_face=False):
+    # With keep_landmarks, face dicts carry the full array of 68 predicted landmarks along with the path of their
+    # predictor, which aligners using the same predictor can reuse instead of predicting them once again
+    def __init__(self, landmarks_predictor_path=LANDMARKS_PREDICTOR_PATH, single_face=False, keep_landmarks=True):
         self.NormalizationTime = 0
-        self.Detector = dlib.get_frontal_face_detector()
-        self.LandmarksPredictor = dlib.shape_predictor(landmarks_predictor_path)
+        self.LandmarksPredictorPath = landmarks_predictor_path
+        self.KeepLandmarks = keep_landmarks
+        self.load_models()
         super().__init__(single_face)
 
+    def load_models(self):
+        self.Detector = dlib.get_frontal_face_detector()
+        self.LandmarksPredictor = dlib.shape_predictor(self.LandmarksPredictorPath)
+
+    def get_detection_config(self):
+        predictor_size = os.path.getsize(self.LandmarksPredictorPath)
+        predictor_name = os.path.basename(self.LandmarksPredictorPath)
+
+        return f"upsample=1|{predictor_name}|{predictor_size}|landmarks={self.KeepLandmarks}"
+
     def get_bounding_boxes(self, image):
         faces = self.Detector(image, 1)
         boxes = list()
@@ -128,6 +283,9 @@ class FaceExtractorDlib(FaceExtractor):
             "nose": points[NOSE].mean(axis=0).astype("int")
         }})
 
+        if self.KeepLandmarks:
+            box.update({"landmarks": points, "landmarks_predictor": self.LandmarksPredictorPath})
+
         return box
 
 
@@ -136,3 +294,65 @@ class FaceExtractorLFW(FaceExtractorDlib):
 
     def get_bounding_boxes(self, image):
         return [self.get_face_dict(image, 0, 0, image.shape[1], image.shape[0])]
+
+
+worker_extractor = None
+worker_aligner = None
+
+
+def init_extraction_worker(extractor, aligner):
+    global worker_extractor, worker_aligner
+
+    worker_extractor = extractor
+    worker_aligner = aligner
+
+
+# Detections missing from the cache are detected here and sent back to be stored by the parent process
+def extract_image_in_worker(save_path, rgb, task):
+    image_path, detections = task
+    image, _, _ = load_image(image_path, rgb)
+
+    new_detections = None
+    if detections is None:
+        detections = new_detections = worker_extractor.get_bounding_boxes(image)
+
+    normalization_time = worker_extractor.NormalizationTime
+    faces_num = worker_extractor.extract_image_faces(image, image_path, save_path, worker_aligner, detections)
+
+    return image_path, faces_num, worker_extractor.NormalizationTime - normalization_time, new_detections
+
+
+def get_image_name(image_path):
+    sep_pos = image_path.rfind("/") + 1
+    dot_pos = image_path.rfind('.')
+
+    return image_path[sep_pos:dot_pos].replace("\\", "/")
+
+
+def get_face_path(save_path, image_path, idx):
+    image_name = get_image_name(image_path)
+
+    return f"{save_path}/{image_name}/{image_name}_face_{idx}.jpg"
+
+
+# Reads "image path\tnumber of faces" lines of an extraction manifest, keeping the images whose faces are all saved
+def read_extraction_manifest(manifest_path, save_path):
+    completed = dict()
+
+    if not os.path.isfile(manifest_path):
+        return completed
+
+    with open(manifest_path, "r") as manifest:
+        lines = manifest.read().split("\n")
+
+    # The last line is either empty or torn by an interruption
+    for line in lines[:-1]:
+        image_path, sep, faces_num = line.rpartition("\t")
+
+        if not sep or not faces_num.isdigit():
+            continue
+
+        if all(os.path.isfile(get_face_path(save_path, image_path, idx)) for idx in range(int(faces_num))):
+            completed[image_path] = int(faces_num)
+
+    return completed
@@ -1,3 +1,4 @@
+import os
 import cv2
 import dlib
 
@@ -8,30 +9,52 @@ from src.extraction.normalization_utils import distance, rotate_point, is_betwee
     INNER_EYES_AND_BOTTOM_LIP, OUTER_EYES_AND_NOSE, MINMAX_TEMPLATE
 
 
-# Abstract class for face normalizing
+# Abstract class for face normalizing. Models in ModelAttributes can not be pickled, so a normalizer sent
+# to another process is pickled without them and loads its own models with load_models.
 class FaceNormalizer:
     Name = "Default Aligner Name"
+    ModelAttributes = ()
 
     @abstractmethod
     def normalize_face(self, image, face):
         ...
 
+    def load_models(self):
+        pass
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items() if name not in self.ModelAttributes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.load_models()
+
 
 class MappingAligner(FaceNormalizer):
     Name = "Dlib Mapping Aligner"
+    ModelAttributes = ("Predictor",)
 
     def __init__(self, indices=OUTER_EYES_AND_NOSE, detector_path=LANDMARKS_PREDICTOR_PATH, target_size=(224, 224)):
-        self.Predictor = dlib.shape_predictor(detector_path)
+        self.DetectorPath = detector_path
         self.Indices = indices
         self.TargetSize = target_size
+        self.load_models()
 
+    def load_models(self):
+        self.Predictor = dlib.shape_predictor(self.DetectorPath)
+
+    # Landmarks predicted by the extractor for the same box are used when the face carries them and they come from
+    # the same predictor, otherwise they are predicted once again
     def normalize_face(self, image, face):
-        x, y, w, h = face["box"]
-        bounding_box = dlib.rectangle(x, y, x + w, y + h)
+        landmarks = self.get_face_landmarks(face)
 
-        points = self.Predictor(image, bounding_box)
-        landmarks = list(map(lambda p: (p.x, p.y), points.parts()))
-        landmarks = np.float32(landmarks)
+        if landmarks is None:
+            x, y, w, h = face["box"]
+            bounding_box = dlib.rectangle(x, y, x + w, y + h)
+
+            points = self.Predictor(image, bounding_box)
+            landmarks = list(map(lambda p: (p.x, p.y), points.parts()))
+            landmarks = np.float32(landmarks)
 
         landmark_indices = np.array(self.Indices)
         desired_points = MINMAX_TEMPLATE[landmark_indices] * np.array(self.TargetSize, dtype="float32")
@@ -41,6 +64,14 @@ class MappingAligner(FaceNormalizer):
 
         return image
 
+    def get_face_landmarks(self, face):
+        predictor_path = face.get("landmarks_predictor")
+
+        if predictor_path is None or os.path.realpath(predictor_path) != os.path.realpath(self.DetectorPath):
+            return None
+
+        return face.get("landmarks")
+
 
 class EyesNoseAligner(FaceNormalizer):
     Name = "Eyes Nose Aligner"
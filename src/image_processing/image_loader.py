@@ -1,13 +1,18 @@
 import os
 import cv2
 
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
 from timeit import default_timer
 
 
 # Class for loading images from directories. Provides an image generator method.
+# With workers > 0 images are decoded and processed ahead of the consumer by a pool of threads or processes,
+# keeping at most prefetch images in flight, and are still yielded in order.
 class ImageLoader:
 
-    def __init__(self, path, preproc_func=None, target_size=None, rgb=False):
+    def __init__(self, path, preproc_func=None, target_size=None, rgb=False, workers=0, prefetch=None,
+                 processes=False):
         self.ImagePreprocessingTime = 0
         self.ImageResizeTime = 0
         self.ColorModeRGB = rgb
@@ -15,6 +20,9 @@ class ImageLoader:
         self.ImageDirectoryPath = path
         self.PreprocessFunction = preproc_func
         self.TargetSize = target_size
+        self.Workers = workers
+        self.PrefetchSize = prefetch if prefetch is not None else 2 * workers
+        self.UseProcesses = processes
         self.ImagesList = []
 
         for root, _, files in os.walk(path):
@@ -24,27 +32,75 @@ class ImageLoader:
 
     # A generator method
     def next_image(self):
+        if self.Workers > 0:
+            yield from self.prefetch_images()
+            return
+
         for image_path in self.ImagesList:
-            image = cv2.imread(image_path, 1)
+            image, resize_time, preprocessing_time = load_image(image_path, self.ColorModeRGB, self.TargetSize,
+                                                                self.PreprocessFunction)
 
-            if self.ColorModeRGB:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            self.ImageResizeTime += resize_time
+            self.ImagePreprocessingTime += preprocessing_time
 
-            if self.TargetSize is not None:
-                start = default_timer()
-                image = cv2.resize(image, self.TargetSize, interpolation=cv2.INTER_CUBIC)
-                end = default_timer()
+            yield image, image_path
 
-                self.ImageResizeTime += (end - start)
+    def prefetch_images(self):
+        executor_class = ProcessPoolExecutor if self.UseProcesses else ThreadPoolExecutor
+        image_paths = iter(self.ImagesList)
+        pending = deque()
 
-            if self.PreprocessFunction is not None:
-                start = default_timer()
-                image = self.PreprocessFunction(image)
-                end = default_timer()
+        with executor_class(max_workers=self.Workers) as executor:
+            def submit_next():
+                image_path = next(image_paths, None)
 
-                self.ImagePreprocessingTime += (end - start)
+                if image_path is not None:
+                    future = executor.submit(load_image, image_path, self.ColorModeRGB, self.TargetSize,
+                                             self.PreprocessFunction)
+                    pending.append((future, image_path))
 
-            yield image, image_path
+            for _ in range(max(self.PrefetchSize, 1)):
+                submit_next()
+
+            while pending:
+                future, image_path = pending.popleft()
+                image, resize_time, preprocessing_time = future.result()
+                submit_next()
+
+                self.ImageResizeTime += resize_time
+                self.ImagePreprocessingTime += preprocessing_time
+
+                yield image, image_path
 
     def get_total_images_number(self):
         return len(self.ImagesList)
+
+
+def load_image(image_path, rgb=False, target_size=None, preproc_func=None):
+    image = cv2.imread(image_path, 1)
+
+    if rgb:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    return prepare_image(image, target_size, preproc_func)
+
+
+def prepare_image(image, target_size=None, preproc_func=None):
+    resize_time = 0
+    preprocessing_time = 0
+
+    if target_size is not None:
+        start = default_timer()
+        image = cv2.resize(image, target_size, interpolation=cv2.INTER_CUBIC)
+        end = default_timer()
+
+        resize_time = end - start
+
+    if preproc_func is not None:
+        start = default_timer()
+        image = preproc_func(image)
+        end = default_timer()
+
+        preprocessing_time = end - start
+
+    return image, resize_time, preprocessing_time
@@ -1,222 +1,324 @@
-from src.clustering.algorithms.app_rank_order import cluster_app_rank_order
-from src.clustering.algorithms.rank_order import cluster_rank_order
-from src.clustering.algorithms.scikit_algorithms import cluster_mean_shift, cluster_dbscan, cluster_kmeans, \
-    cluster_affinity_propagation, cluster_spectral, cluster_agglomerative, cluster_optics
-from src.image_processing.image_loader import ImageLoader
-from src.clustering.clustering_utils import find_taxicab_distance, find_cosine_similarity, find_euclidean_distance
-from src.embedding.models_code.face_net import FaceNet
-from src.embedding.models_code.open_face import OpenFace
-from src.embedding.models_code.vgg_face import FaceVGG16, FaceVGGResNet, FaceVGGSqueezeNet
-from src.test_system.evaluation import evaluate_normalizers, evaluate_embeddings_creator, \
-    evaluate_clustering_algorithms
-from src.extraction.face_normalization import EyesNoseAligner, EyesOnlyAligner, MappingAligner, FaceCropperVGG
-from src.clustering.algorithms.algorithms import chinese_whispers, cluster_threshold, chinese_whispers_dlib
-from src.extraction.face_extraction import FaceExtractorDlib, FaceExtractorMTCNN, FaceExtractorLFW
-from src.test_system.logging import get_file_logger
+from src.registry import ALGORITHMS, MODELS, EXTRACTORS, NORMALIZERS, resolve_algorithm, resolve_model, \
+    resolve_extractor, resolve_normalizer
 
+from argparse import ArgumentParser
 from timeit import default_timer
-from tqdm import trange
 
-import numpy as np
-import cv2
+import ast
+import os
 
-embeddings_dir = "./results/embeddings"
-save_path = "./results/extraction/LFW"
-# save_path = "./lfw/images/test"
-load_path = "./results/extraction/LFW/Dlib-based Face Extractor/Dlib Mapping Aligner"
-images_path = "./results/extraction/LFW/lfw-mtcnn-aligned"
-# images_path = "./lfw/images/test/test"
-sorted_path = "./results/clustered"
+# Heavy dependencies (TensorFlow, dlib, MTCNN, scikit-learn, FLANN) are only imported by the subcommand that needs
+# them, so that clustering a ready embeddings file does not pay for loading the models.
 
-facenet_sandberg_weights = "./models/facenet_david_sandberg/facenet_weights.h5"
-facenet_hiroki_weights = "./models/facenet_hiroki_taniai/facenet_hiroki_weights.h5"
-openface_weights = "./models/open_face/openface_weights.h5"
-vgg_face_weights = "./models/vgg_face/vgg_face_weights.h5"
 
+def parse_value(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
 
-def test_extraction_and_alignment():
-    logger = get_file_logger()
 
-    extractors = list()
-    # extractors.append(FaceExtractorMTCNN())
-    # extractors.append(FaceExtractorDlib())
-    extractors.append(FaceExtractorLFW())
+# Parses "name=value" pairs into a params dict, values are parsed as Python literals and fall back to strings
+def parse_params(pairs):
+    params = dict()
 
-    normalizers = list()
-    normalizers.append(EyesOnlyAligner(left_eye=(0.35, 0.35)))
-    normalizers.append(EyesNoseAligner())
-    normalizers.append(MappingAligner())
-    normalizers.append(FaceCropperVGG())
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected parameter in form name=value, got {pair}")
 
-    evaluate_normalizers(images_path, save_path, extractors, normalizers, logger=logger)
+        params[name] = parse_value(value)
 
+    return params
 
-def test_embeddings_creation(faces_path, result_path):
-    logger = get_file_logger()
+
+# Parses "name=values" pairs into a params range, where values are either comma separated or start:stop:step.
+# Integer bounds give a range, so that integer parameters such as numbers of neighbors stay integers.
+def parse_params_range(pairs):
+    import numpy as np
+
+    params_range = dict()
+
+    for pair in pairs:
+        name, sep, values = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected parameter range in form name=values, got {pair}")
+
+        if ":" in values:
+            start, stop, step = map(parse_value, values.split(":"))
+
+            if all(isinstance(value, int) for value in (start, stop, step)):
+                params_range[name] = range(start, stop, step)
+            else:
+                params_range[name] = np.arange(start, stop, step)
+        else:
+            params_range[name] = [parse_value(value) for value in values.split(",")]
+
+    return params_range
+
+
+def get_compaction(args):
+    return {"n_components": args.pca, "whiten": args.whiten, "projection_path": args.projection,
+            "dtype": "float16" if args.float16 else "float32"}
+
+
+def add_compaction_arguments(parser):
+    parser.add_argument("--pca", type=int, metavar="N_COMPONENTS")
+    parser.add_argument("--whiten", action="store_true")
+    parser.add_argument("--projection", metavar="PROJECTION_PATH")
+    parser.add_argument("--float16", action="store_true")
+
+
+def get_logger(log_file):
+    from src.test_system.logging import get_file_logger
+
+    return get_file_logger() if log_file else None
+
+
+def extract(args):
+    from src.test_system.evaluation import evaluate_normalizers
+
+    extractors = [resolve_extractor(name)() for name in args.extractor]
+    normalizers = [resolve_normalizer(name)() for name in args.normalizer]
+
+    detection_cache = None
+    if args.detection_cache is not None:
+        from src.extraction.detection_cache import DetectionCache
+
+        detection_cache = DetectionCache(args.detection_cache)
+
+    evaluate_normalizers(args.images_path, args.save_path, extractors, normalizers, logger=get_logger(args.log_file),
+                         loader_workers=args.workers, resume=args.resume, extraction_workers=args.processes,
+                         detect_once=args.detect_once, detection_cache=detection_cache)
+
+    if detection_cache is not None:
+        detection_cache.close()
+
+
+def resolve_models(args):
+    weights = parse_params(args.weights)
 
     models = list()
-    # models.append((FaceNet, {"weights_path": facenet_sandberg_weights}))
-    # models.append((OpenFace, {"weights_path": openface_weights}))
-    # models.append((FaceVGGSqueezeNet, {}))
-    # models.append((FaceVGGResNet, {}))
-    models.append((FaceVGG16, {}))
-
-    evaluate_embeddings_creator(models, faces_path, result_path, logger=logger)
-
-
-def elijah_test_1():
-    embedding_file = embeddings_dir + "/LFW/Dlib Mapping Aligner/OpenFace.txt"
-    algorithms = dict()
-
-    threshold_range = {"threshold": [0.48], "distance": [find_euclidean_distance]}
-    algorithms.update({"Threshold Clustering": (cluster_threshold, threshold_range)})
-
-    # chinese_whisperers_range = {"threshold": [0.62]}
-    # algorithms.update({"Chinese Whisperers": (chinese_whispers_dlib, chinese_whisperers_range)})
-    #
-    # mean_shift_range = {"bandwidth": [0.54]}
-    # algorithms.update({"Mean Shift": (cluster_mean_shift, mean_shift_range)})
-    #
-    # dbscan_range = {"eps": [0.58], "min_samples": [1], "metric": ['euclidean']}
-    # algorithms.update({"DBSCAN": (cluster_dbscan, dbscan_range)})
-
-    # app_rank_order_range = {"threshold": np.arange(0.1, 0.4, 0.01), "n_neighbors": range(10, 1000, 10),
-    #                         "distance": ["euclidean"]}
-    # algorithms.update({"Approximate Rank-Order": (cluster_app_rank_order, app_rank_order_range)})
-    #
-    # affinity_range = {"damping": np.arange(0.6, 1, 0.02)}
-    # algorithms.update({"Affinity Propagation": (cluster_affinity_propagation, affinity_range)})
-    #
-    # agglomerative_range = {"n_clusters": [None], "distance_threshold": np.arange(0.75, 1.25, 0.01)}
-    # algorithms.update({"Agglomerative Clustering": (cluster_agglomerative, agglomerative_range)})
-    #
-    # optics_range = {"min_samples": range(1, 5), "eps": np.arange(0.7, 1.2, 0.01), "cluster_method": ["dbscan"],
-    #                 "metric": ["euclidean"], "max_eps": [2]}
-    # algorithms.update({"OPTICS": (cluster_optics, optics_range)})
-    #
-    # rank_order_range = {"threshold": range(1, 100, 5), "k_neighbors": range(10, 1000, 10),
-    #                     "distance": ["euclidean"]}
-    # algorithms.update({"Rank-Order": (cluster_rank_order, rank_order_range)})
-
-    # kmeans_range = {"n_clusters": [5320]}
-    # algorithms.update({"K-means": (cluster_kmeans, kmeans_range)})
-
-    evaluate_clustering_algorithms(algorithms, embedding_path=embedding_file, n_threads=1,
-                                   inter_logging=True)
-
-
-def test_embeddings_creation_time():
-    models = [FaceVGGSqueezeNet()]
-    image = "./lfw/images/lfw/Aaron_Eckhart/Aaron_Eckhart_0001.jpg"
-
-    image = cv2.imread(image)
-    for model in models:
-        times = []
-        for _ in trange(10000):
-            begin = default_timer()
-            processed = cv2.resize(image, model.InputSize, interpolation=cv2.INTER_CUBIC)
-            processed = model.preprocess_input(processed)
-            model.predict(processed)
-            end = default_timer()
-            times.append(end - begin)
-
-        print(f"mean: {np.array(times).mean()} std: {np.array(times).std()}\n")
-
-
-def test_small_subset():
-    embedding_file = embeddings_dir + "/LFW/lfw-mtcnn-aligned/SqueezeNetVGG.txt"
-
-    algorithms = dict()
-
-    # threshold_range = {"threshold": np.arange(0.2, 1, 0.02), "distance": [find_euclidean_distance]}
-    # algorithms.update({"Threshold Clustering": (cluster_threshold, threshold_range)})
-
-    chinese_whisperers_range = {"threshold": np.arange(0.2, 1, 0.01)}
-    algorithms.update({"Chinese Whisperers": (chinese_whispers_dlib, chinese_whisperers_range)})
-    #
-    # mean_shift_range = {"bandwidth": np.arange(0.01, 1, 0.02)}
-    # algorithms.update({"Mean Shift": (cluster_mean_shift, mean_shift_range)})
-    #
-    # dbscan_range = {"eps": np.arange(0.2, 1, 0.02), "min_samples": [1], "metric": ['euclidean']}
-    # algorithms.update({"DBSCAN": (cluster_dbscan, dbscan_range)})
-    #
-    # affinity_range = {"damping": np.arange(0.5, 1, 0.02)}
-    # algorithms.update({"Affinity Propagation": (cluster_affinity_propagation, affinity_range)})
-
-    app_rank_order_range = {"threshold": np.arange(0.1, 1, 0.02), "n_neighbors": range(10, 30, 2),
-                            "distance": ["euclidean"]}
-    algorithms.update({"Approximate Rank-Order": (cluster_app_rank_order, app_rank_order_range)})
-
-    # agglomerative_range = {"n_clusters": [None], "distance_threshold": np.arange(1, 2, 0.02)}
-    # algorithms.update({"Agglomerative Clustering": (cluster_agglomerative, agglomerative_range)})
-    #
-    # kmeans_range = {"n_clusters": range(20, 40, 2)}
-    # algorithms.update({"K-means": (cluster_kmeans, kmeans_range)})
-    #
-    # spectral_range = {"n_clusters": range(20, 40, 2)}
-    # algorithms.update({"Spectral Clustering": (cluster_spectral, spectral_range)})
-
-    rank_order_range = {"threshold": np.arange(14, 16, 0.1), "k_neighbors": range(4, 13, 1),
-                        "distance": ["euclidean"]}
-    algorithms.update({"Rank-Order": (cluster_rank_order, rank_order_range)})
-
-    evaluate_clustering_algorithms(algorithms, embedding_path=embedding_file, n_threads=1, top_n=100,
-                                   inter_logging=False)
-
-
-def test_clustering_algorithms(embedding_file):
-    logger = get_file_logger()
-
-    algorithms = dict()
-    distances = [find_euclidean_distance, find_cosine_similarity, find_taxicab_distance]
-
-    threshold_range = {"threshold": [0], "distance": [find_euclidean_distance]}
-    algorithms.update({"Threshold Clustering": (cluster_threshold, threshold_range)})
-
-    # chinese_whisperers_range = {"threshold": [1, 3, 5, 10], "iterations": [10], "distance": [find_euclidean_distance]}
-    # algorithms.update({"Chinese Whisperers": (chinese_whisperers, chinese_whisperers_range)})
-    #
-    # rank_order_range = {"threshold": np.arange(0, 11, 0.1), "k_neighbors": range(7, 17),
-    #                     "distance": ["euclidean", "manhattan"]}
-    # algorithms.update({"Rank-Order": (cluster_rank_order, rank_order_range)})
-
-    # mean_shift_range = {"bandwidth": np.arange(0.1, 10.0, 0.2), "n_jobs": [-1]}
-    # algorithms.update({"Mean Shift": (cluster_mean_shift, mean_shift_range)})
-    #
-    # dbscan_range = {"eps": range(1, 50), "min_samples": range(1, 8), "metric": distances}
-    # algorithms.update({"DBSCAN": (cluster_dbscan, dbscan_range)})
-    #
-    # kmeans_range = {"n_clusters": range(1, 10), "random_state": range(50, 300, 10)}
-    # algorithms.update({"K-means": (cluster_kmeans, kmeans_range)})
-    #
-    # affinity_range = {"damping": np.arange(0.5, 1, 0.1)}
-    # algorithms.update({"Affinity Propagation": (cluster_affinity_propagation, affinity_range)})
-    #
-    # spectral_range = {"n_clusters": range(1, 10), "random_state": range(50, 300, 10)}
-    # algorithms.update({"Spectral Clustering": (cluster_spectral, spectral_range)})
-    #
-    # agglomerative_range = {"n_clusters": [None], "distance_threshold": np.arange(0.01, 10, 0.01)}
-    # algorithms.update({"Agglomerative Clustering": (cluster_agglomerative, agglomerative_range)})
-    #
-    # optics_range = {"min_samples": range(2, 10), "metric": distances}
-    # algorithms.update({"OPTICS": (cluster_optics, optics_range)})
-
-    evaluate_clustering_algorithms(algorithms, embedding_path=embedding_file, results_path=sorted_path)
-
-
-def main():
-    # elijah_test_1()
-    # test_extraction_and_alignment()
-    #
-    # faces = "./results/extraction/LFW/lfw-mtcnn-aligned"
-    # embeddings = "./results/embeddings/LFW/lfw-mtcnn-aligned"
-
-    # test_embeddings_creation(faces, embeddings)
-
-    test_small_subset()
-    # test_embeddings_creation_time()
-
-    # elijah_test_1()
+    for name in args.model:
+        model_constructor, kwargs = resolve_model(name)
+        if name in weights:
+            kwargs["weights_path"] = weights[name]
+
+        models.append((model_constructor, kwargs))
+
+    return models
+
+
+def get_models(args):
+    backends = parse_params(args.backend)
+    backends_params = get_backends_params(args)
+
+    models = resolve_models(args)
+    for name, (_, kwargs) in zip(args.model, models):
+        if name in backends:
+            kwargs["backend"] = backends[name]
+            kwargs["backend_params"] = backends_params.get(backends[name], dict())
+
+    return models
+
+
+def get_backends_params(args):
+    return {
+        "frozen-graph": {"intra_op_threads": args.intra_op_threads, "inter_op_threads": args.inter_op_threads},
+        "tflite-int8": {"calibration_path": args.calibration_path or args.faces_path,
+                        "calibration_size": args.calibration_size, "num_threads": args.intra_op_threads or None}
+    }
+
+
+def get_models_cache(args):
+    if args.models_cache is None:
+        return None
+
+    from src.embedding.models_cache import ModelsCache
+
+    return ModelsCache(args.models_cache)
+
+
+# Compares every model given a backend with its Keras model on a sample of faces, instead of creating embeddings
+def compare_backends(args):
+    from src.test_system.evaluation import evaluate_inference_backend
+
+    backends = parse_params(args.backend)
+    backends_params = get_backends_params(args)
+    models_cache = get_models_cache(args)
+    logger = get_logger(args.log_file)
+
+    for name, model in zip(args.model, resolve_models(args)):
+        if name not in backends:
+            raise ValueError(f"No backend to compare for model {name}, expected --backend {name}=BACKEND")
+
+        evaluate_inference_backend([model], args.faces_path, backends[name], backends_params.get(backends[name]),
+                                   sample_size=args.sample_size, logger=logger, models_cache=models_cache,
+                                   tolerance=args.tolerance)
+
+
+def embed(args):
+    from src.test_system.evaluation import evaluate_embeddings_creator
+
+    if args.compare_backend:
+        compare_backends(args)
+        return
+
+    models = get_models(args)
+
+    cache = None
+    if args.cache is not None:
+        from src.embedding.embeddings_cache import EmbeddingsCache
+
+        cache = EmbeddingsCache(args.cache)
+
+    models_cache = get_models_cache(args)
+
+    evaluate_embeddings_creator(models, args.faces_path, args.embeddings_dir, logger=get_logger(args.log_file),
+                                batch_size=args.batch_size, loader_workers=args.workers, cache=cache,
+                                multi_model=args.multi_model, models_cache=models_cache, shards=args.shards,
+                                intra_op_threads=args.intra_op_threads or 1, resume=args.resume)
+
+    if cache is not None:
+        cache.close()
+
+
+def cluster(args):
+    from src.clustering.clustering import ImageClusteringUnit
+
+    algorithm = resolve_algorithm(args.algorithm)
+    params_dict = parse_params(args.param) if args.param else None
+
+    clustering_unit = ImageClusteringUnit(args.embedding_path, **get_compaction(args))
+    if args.save_projection is not None:
+        clustering_unit.save_projection(args.save_projection)
+
+    start_time = default_timer()
+    results = clustering_unit.cluster_images(algorithm, params_dict, top_n=args.top_n)
+    end_time = default_timer()
+
+    clusters_num = len(set(label for _, label in results))
+    print(f"Clustered {len(results)} vectors into {clusters_num} clusters with {args.algorithm} "
+          f"in {end_time - start_time}s")
+
+    if args.sorted_path is not None:
+        from src.image_processing.image_utils import sort_images
+
+        if not os.path.exists(args.sorted_path):
+            os.mkdir(args.sorted_path)
+
+        sort_images(results, args.sorted_path)
+
+
+def evaluate(args):
+    from src.test_system.evaluation import evaluate_clustering_algorithms
+
+    algorithms = {args.algorithm: (resolve_algorithm(args.algorithm), parse_params_range(args.param))}
+
+    evaluate_clustering_algorithms(algorithms, embedding_path=args.embedding_path, results_path=args.sorted_path,
+                                   top_n=args.top_n, logger=get_logger(args.log_file), n_threads=args.threads,
+                                   inter_logging=args.inter_logging, compaction=get_compaction(args))
+
+
+def quantize_report(args):
+    from src.test_system.evaluation import evaluate_quantization
+
+    algorithms = {args.algorithm: (resolve_algorithm(args.algorithm), parse_params_range(args.param))}
+
+    evaluate_quantization(resolve_models(args), args.faces_path, args.embeddings_dir, algorithms,
+                          calibration_path=args.calibration_path, calibration_size=args.calibration_size,
+                          logger=get_logger(args.log_file), batch_size=args.batch_size, n_threads=args.threads,
+                          models_cache=get_models_cache(args))
+
+
+def create_parser():
+    parser = ArgumentParser(description="Face extraction, embedding and clustering pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = subparsers.add_parser("extract", help="extract and normalize faces from images")
+    extract_parser.add_argument("images_path")
+    extract_parser.add_argument("save_path")
+    extract_parser.add_argument("--extractor", action="append", choices=list(EXTRACTORS), required=True)
+    extract_parser.add_argument("--normalizer", action="append", choices=list(NORMALIZERS), required=True)
+    extract_parser.add_argument("--workers", type=int, default=0)
+    extract_parser.add_argument("--processes", type=int, default=0, help="number of extraction worker processes")
+    extract_parser.add_argument("--detect-once", action="store_true", help="detect faces of every image once and "
+                                                                           "apply all normalizers to them")
+    extract_parser.add_argument("--detection-cache", metavar="CACHE_DIR")
+    extract_parser.add_argument("--resume", action="store_true")
+    extract_parser.add_argument("--log-file", action="store_true")
+    extract_parser.set_defaults(func=extract)
+
+    embed_parser = subparsers.add_parser("embed", help="create embeddings of extracted faces")
+    embed_parser.add_argument("faces_path")
+    embed_parser.add_argument("embeddings_dir")
+    embed_parser.add_argument("--model", action="append", choices=list(MODELS), required=True)
+    embed_parser.add_argument("--weights", action="append", default=[], metavar="MODEL=PATH")
+    embed_parser.add_argument("--backend", action="append", default=[], metavar="MODEL=BACKEND")
+    embed_parser.add_argument("--intra-op-threads", type=int, default=0)
+    embed_parser.add_argument("--inter-op-threads", type=int, default=0)
+    embed_parser.add_argument("--calibration-path")
+    embed_parser.add_argument("--calibration-size", type=int, default=100)
+    embed_parser.add_argument("--batch-size", type=int)
+    embed_parser.add_argument("--workers", type=int, default=0)
+    embed_parser.add_argument("--cache", metavar="CACHE_PATH")
+    embed_parser.add_argument("--models-cache", metavar="CACHE_DIR")
+    embed_parser.add_argument("--multi-model", action="store_true")
+    embed_parser.add_argument("--shards", type=int, default=0, help="number of worker processes, each with its "
+                                                                    "own shard of images")
+    embed_parser.add_argument("--resume", action="store_true")
+    embed_parser.add_argument("--compare-backend", action="store_true", help="compare speed and embeddings of the "
+                                                                             "backends with the Keras models on "
+                                                                             "a sample of faces")
+    embed_parser.add_argument("--sample-size", type=int, default=256)
+    embed_parser.add_argument("--tolerance", type=float, default=1e-4)
+    embed_parser.add_argument("--log-file", action="store_true")
+    embed_parser.set_defaults(func=embed)
+
+    cluster_parser = subparsers.add_parser("cluster", help="cluster embeddings with a single set of parameters")
+    cluster_parser.add_argument("embedding_path")
+    cluster_parser.add_argument("--algorithm", choices=list(ALGORITHMS), required=True)
+    cluster_parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE")
+    cluster_parser.add_argument("--top-n", type=int)
+    cluster_parser.add_argument("--sorted-path")
+    cluster_parser.add_argument("--save-projection", metavar="PROJECTION_PATH")
+    add_compaction_arguments(cluster_parser)
+    cluster_parser.set_defaults(func=cluster)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="grid search clustering parameters on labeled faces")
+    evaluate_parser.add_argument("embedding_path")
+    evaluate_parser.add_argument("--algorithm", choices=list(ALGORITHMS), required=True)
+    evaluate_parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES")
+    evaluate_parser.add_argument("--top-n", type=int)
+    evaluate_parser.add_argument("--sorted-path")
+    evaluate_parser.add_argument("--threads", type=int, default=1)
+    evaluate_parser.add_argument("--inter-logging", action="store_true")
+    evaluate_parser.add_argument("--log-file", action="store_true")
+    add_compaction_arguments(evaluate_parser)
+    evaluate_parser.set_defaults(func=evaluate)
+
+    quantize_parser = subparsers.add_parser("quantize-report", help="compare throughput and clustering quality "
+                                                                     "of float32 and int8 embeddings")
+    quantize_parser.add_argument("faces_path")
+    quantize_parser.add_argument("embeddings_dir")
+    quantize_parser.add_argument("--model", action="append", choices=list(MODELS), required=True)
+    quantize_parser.add_argument("--weights", action="append", default=[], metavar="MODEL=PATH")
+    quantize_parser.add_argument("--calibration-path")
+    quantize_parser.add_argument("--calibration-size", type=int, default=100)
+    quantize_parser.add_argument("--algorithm", choices=list(ALGORITHMS), required=True)
+    quantize_parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES")
+    quantize_parser.add_argument("--batch-size", type=int)
+    quantize_parser.add_argument("--threads", type=int, default=1)
+    quantize_parser.add_argument("--models-cache", metavar="CACHE_DIR")
+    quantize_parser.add_argument("--log-file", action="store_true")
+    quantize_parser.set_defaults(func=quantize_report)
+
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    args.func(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+from importlib import import_module
+
+# Registries map names to (module, attribute) pairs, and the modules are only imported when a name is resolved,
+# so that heavy dependencies like TensorFlow, dlib or scikit-learn are only loaded when they are needed.
+
+ALGORITHMS = {
+    "threshold": ("src.clustering.algorithms.algorithms", "cluster_threshold"),
+    "chinese-whispers": ("src.clustering.algorithms.algorithms", "chinese_whispers"),
+    "chinese-whispers-dlib": ("src.clustering.algorithms.algorithms", "chinese_whispers_dlib"),
+    "rank-order": ("src.clustering.algorithms.rank_order", "cluster_rank_order"),
+    "app-rank-order": ("src.clustering.algorithms.app_rank_order", "cluster_app_rank_order"),
+    "kmeans": ("src.clustering.algorithms.scikit_algorithms", "cluster_kmeans"),
+    "dbscan": ("src.clustering.algorithms.scikit_algorithms", "cluster_dbscan"),
+    "mean-shift": ("src.clustering.algorithms.scikit_algorithms", "cluster_mean_shift"),
+    "affinity-propagation": ("src.clustering.algorithms.scikit_algorithms", "cluster_affinity_propagation"),
+    "spectral": ("src.clustering.algorithms.scikit_algorithms", "cluster_spectral"),
+    "agglomerative": ("src.clustering.algorithms.scikit_algorithms", "cluster_agglomerative"),
+    "optics": ("src.clustering.algorithms.scikit_algorithms", "cluster_optics")
+}
+
+MODELS = {
+    "facenet": ("src.embedding.models_code.face_net", "FaceNet",
+                {"weights_path": "./models/facenet_david_sandberg/facenet_weights.h5"}),
+    "facenet-hiroki": ("src.embedding.models_code.face_net", "FaceNet",
+                       {"weights_path": "./models/facenet_hiroki_taniai/facenet_hiroki_weights.h5"}),
+    "openface": ("src.embedding.models_code.open_face", "OpenFace",
+                 {"weights_path": "./models/open_face/openface_weights.h5"}),
+    "vgg16": ("src.embedding.models_code.vgg_face", "FaceVGG16", {}),
+    "resnet": ("src.embedding.models_code.vgg_face", "FaceVGGResNet", {}),
+    "senet": ("src.embedding.models_code.vgg_face", "FaceVGGSqueezeNet", {})
+}
+
+EXTRACTORS = {
+    "mtcnn": ("src.extraction.face_extraction", "FaceExtractorMTCNN"),
+    "dlib": ("src.extraction.face_extraction", "FaceExtractorDlib"),
+    "lfw": ("src.extraction.face_extraction", "FaceExtractorLFW")
+}
+
+NORMALIZERS = {
+    "eyes-only": ("src.extraction.face_normalization", "EyesOnlyAligner"),
+    "eyes-nose": ("src.extraction.face_normalization", "EyesNoseAligner"),
+    "mapping": ("src.extraction.face_normalization", "MappingAligner"),
+    "vgg-crop": ("src.extraction.face_normalization", "FaceCropperVGG")
+}
+
+
+def resolve(registry, name):
+    if name not in registry:
+        raise ValueError(f"Unknown name {name}, expected one of: {', '.join(registry)}")
+
+    module_name, attribute = registry[name][:2]
+
+    return getattr(import_module(module_name), attribute)
+
+
+def resolve_algorithm(name):
+    return resolve(ALGORITHMS, name)
+
+
+def resolve_model(name):
+    model_constructor = resolve(MODELS, name)
+
+    return model_constructor, dict(MODELS[name][2])
+
+
+def resolve_extractor(name):
+    return resolve(EXTRACTORS, name)
+
+
+def resolve_normalizer(name):
+    return resolve(NORMALIZERS, name)
@@ -3,10 +3,13 @@ from src.test_system.evaluation_utils import evaluate_pairwise_metrics, optimal_
 from src.image_processing.image_utils import sort_images
 from src.image_processing.image_loader import ImageLoader
 from src.test_system.logging import get_default_logger
-from src.embedding.embeddings_creation import ImageEmbeddingsCreator
+from src.embedding.embeddings_creation import ImageEmbeddingsCreator, construct_model
+from src.embedding.inference_backends import load_images_sample
+from src.embedding.embeddings_store import load_embeddings_header
 from timeit import default_timer
 
 import os
+import numpy as np
 from enum import Enum, auto
 
 
@@ -14,58 +17,204 @@ class Metric(Enum):
     PRECISION, RECALL, F1 = auto(), auto(), auto()
 
 
-def evaluate_normalizers(images_path, save_path, extractors, normalizers, logger=None):
+def evaluate_normalizers(images_path, save_path, extractors, normalizers, logger=None, loader_workers=0, resume=False,
+                         extraction_workers=0, detect_once=False, detection_cache=None):
     if logger is None:
         logger = get_default_logger("Alignment")
 
+    if detect_once:
+        evaluate_normalizers_detect_once(images_path, save_path, extractors, normalizers, logger, loader_workers,
+                                         detection_cache)
+        return
+
     for extractor in extractors:
         for normalizer in normalizers:
-            loader = ImageLoader(images_path)
+            loader = ImageLoader(images_path, workers=loader_workers)
 
             name = normalizer.Name if normalizer is not None else "No"
-            extractor.extract_faces(loader, save_path, normalizer)
+            extractor.extract_faces(loader, save_path, normalizer, resume=resume, workers=extraction_workers,
+                                    detection_cache=detection_cache)
 
             logger.info(
                 f"{name} normalization of {extractor.ExtractedFaces} faces "
                 f"for {extractor.Name} took {extractor.NormalizationTime}s")
 
+    if detection_cache is not None:
+        logger.info(detection_cache.get_stats_report())
+
+
+# Decodes every image and detects its faces once per extractor, while timing every normalizer separately
+def evaluate_normalizers_detect_once(images_path, save_path, extractors, normalizers, logger, loader_workers=0,
+                                     detection_cache=None):
+    for extractor in extractors:
+        loader = ImageLoader(images_path, workers=loader_workers)
+        extractor.extract_faces_multi(loader, save_path, normalizers, detection_cache)
+
+        logger.info(f"Detection of {extractor.ExtractedFaces} faces for {extractor.Name} took "
+                    f"{extractor.DetectionTime}s")
+
+        for normalizer, normalization_time in zip(normalizers, extractor.NormalizationTimes):
+            name = normalizer.Name if normalizer is not None else "No"
+
+            logger.info(
+                f"{name} normalization of {extractor.ExtractedFaces} faces "
+                f"for {extractor.Name} took {normalization_time}s")
+
+    if detection_cache is not None:
+        logger.info(detection_cache.get_stats_report())
+
 
-def evaluate_embeddings_creator(models, faces_path, embeddings_dir, logger=None):
+def evaluate_embeddings_creator(models, faces_path, embeddings_dir, logger=None, batch_size=None, loader_workers=0,
+                                cache=None, multi_model=False, models_cache=None, shards=0, intra_op_threads=1,
+                                resume=False):
     if logger is None:
         logger = get_default_logger("Embedding")
 
     if not os.path.exists(embeddings_dir):
         os.mkdir(embeddings_dir)
 
+    if multi_model:
+        evaluate_multi_model_embeddings_creator(models, faces_path, embeddings_dir, logger, batch_size,
+                                                loader_workers, models_cache)
+        return
+
+    if shards > 0:
+        evaluate_sharded_embeddings_creator(models, faces_path, embeddings_dir, logger, batch_size, loader_workers,
+                                            models_cache, shards, intra_op_threads, resume)
+        return
+
     for model_constructor, kwargs in models:
-        embeddings_creator = ImageEmbeddingsCreator(faces_path)
+        embeddings_creator = ImageEmbeddingsCreator(faces_path, loader_workers)
 
         start_time = default_timer()
-        model = model_constructor(**kwargs)
+        model = construct_model(model_constructor, kwargs, models_cache)
         end_time = default_timer()
 
         init_time = end_time - start_time
 
-        result_path = f"{embeddings_dir}/{model.Name}.txt"
-        embeddings_creator.create_embeddings(model, result_path)
+        result_path = f"{embeddings_dir}/{model.Name}"
+        embeddings_creator.create_embeddings(model, result_path, batch_size, cache=cache, resume=resume)
 
         logger.info(
             f"Model {model.Name} initialized in {init_time}s, "
             f"image prepocessing took {embeddings_creator.ImagePreprocessingTime}s "
             f"and embeddings creation took {embeddings_creator.EmbeddingsCreationTime}s")
 
+    if cache is not None:
+        logger.info(cache.get_stats_report())
+
+    if models_cache is not None:
+        logger.info(models_cache.get_stats_report())
+
+
+def evaluate_sharded_embeddings_creator(models, faces_path, embeddings_dir, logger, batch_size=None, loader_workers=0,
+                                        models_cache=None, shards=2, intra_op_threads=1, resume=False):
+    for model_constructor, kwargs in models:
+        embeddings_creator = ImageEmbeddingsCreator(faces_path, loader_workers)
+        embeddings_creator.create_embeddings_sharded(model_constructor, kwargs, embeddings_dir, shards,
+                                                     intra_op_threads, batch_size, models_cache, resume)
+
+        reports = embeddings_creator.ShardsReports
+        workers_report = "\n".join(
+            f"Worker {idx}: {report['images']} images, initialized in {report['init_time']}s, "
+            f"utilisation {report['utilisation']:.2%}" for idx, report in enumerate(reports))
+
+        logger.info(
+            f"Model {reports[0]['model']} in {len(reports)} shards with {intra_op_threads} intra-op threads each: "
+            f"{embeddings_creator.ImagesPerSecond:.1f} images/s, "
+            f"image prepocessing took {embeddings_creator.ImagePreprocessingTime}s "
+            f"and embeddings creation took {embeddings_creator.EmbeddingsCreationTime}s\n{workers_report}")
+
+
+def evaluate_multi_model_embeddings_creator(models, faces_path, embeddings_dir, logger, batch_size=None,
+                                            loader_workers=0, models_cache=None):
+    embeddings_creator = ImageEmbeddingsCreator(faces_path, loader_workers)
+
+    initialized_models = list()
+    init_times = list()
+    for model_constructor, kwargs in models:
+        start_time = default_timer()
+        initialized_models.append(construct_model(model_constructor, kwargs, models_cache))
+        end_time = default_timer()
+
+        init_times.append(end_time - start_time)
+
+    result_paths = [f"{embeddings_dir}/{model.Name}" for model in initialized_models]
+    embeddings_creator.create_embeddings_multi(initialized_models, result_paths, batch_size)
+
+    for model, init_time in zip(initialized_models, init_times):
+        logger.info(
+            f"Model {model.Name} initialized in {init_time}s, "
+            f"image prepocessing took {embeddings_creator.ModelsPreprocessingTimes[model.Name]}s "
+            f"and embeddings creation took {embeddings_creator.ModelsCreationTimes[model.Name]}s")
+
+    if models_cache is not None:
+        logger.info(models_cache.get_stats_report())
+
+
+def measure_throughput(keras_model, images, batch_size):
+    # The first batch warms the model up and is not measured
+    keras_model.predict(images[:batch_size], batch_size=batch_size)
+
+    start_time = default_timer()
+    embeddings = keras_model.predict(images, batch_size=batch_size)
+    end_time = default_timer()
+
+    return embeddings, len(images) / (end_time - start_time)
+
 
+# Compares images per second and embeddings of the Keras model and of the inference backend on a sample of faces.
+# Returns the speedup and the max absolute embeddings difference of every model, which should be within tolerance.
+def evaluate_inference_backend(models, faces_path, backend, backend_params=None, sample_size=256, logger=None,
+                               models_cache=None, tolerance=1e-4):
+    if logger is None:
+        logger = get_default_logger("Inference")
+
+    if backend_params is None:
+        backend_params = dict()
+
+    results = dict()
+    for model_constructor, kwargs in models:
+        model = construct_model(model_constructor, kwargs, models_cache)
+        images = load_images_sample(faces_path, model, sample_size)
+
+        embeddings, keras_throughput = measure_throughput(model.Model, images, model.BatchSize)
+
+        start_time = default_timer()
+        model.set_inference_backend(backend, models_cache, **backend_params)
+        end_time = default_timer()
+
+        backend_embeddings, backend_throughput = measure_throughput(model.Model, images, model.BatchSize)
+        max_difference = np.abs(embeddings - backend_embeddings).max()
+        speedup = backend_throughput / keras_throughput
+        results[model.Name] = {"speedup": speedup, "max_difference": max_difference}
+
+        logger.info(
+            f"Model {model.Name} on {len(images)} images: Keras {keras_throughput:.1f} images/s, "
+            f"{backend} {backend_throughput:.1f} images/s (set up in {end_time - start_time}s), "
+            f"speedup {speedup:.2f}x, max absolute embeddings difference {max_difference} "
+            f"({'within' if max_difference <= tolerance else 'above'} tolerance {tolerance})")
+
+    return results
+
+
+# Compaction is a dict of ImageClusteringUnit compaction arguments, e.g. {"n_components": 128, "dtype": "float16"}
 def evaluate_clustering_algorithms(algorithms_params_dict, embedding_path, results_path=None, top_n=None, logger=None,
-                                   n_threads=1, inter_logging=False):
+                                   n_threads=1, inter_logging=False, compaction=None):
     if logger is None:
         logger = get_default_logger("Clustering")
 
-    clustering_unit = ImageClusteringUnit(embedding_path)
+    if compaction is None:
+        compaction = dict()
+
+    clustering_unit = ImageClusteringUnit(embedding_path, **compaction)
     vectors_num = clustering_unit.get_total_vectors_number() if top_n is None else top_n
+    best_results = dict()
 
     for name, (algorithm, params_range) in algorithms_params_dict.items():
         results_dict = optimal_params_grid_search(clustering_unit, algorithm, name, params_range, top_n, n_threads,
                                                   inter_logging)
+        best_results[name] = results_dict
 
         results = results_dict["results"]
 
@@ -90,3 +239,60 @@ def evaluate_clustering_algorithms(algorithms_params_dict, embedding_path, resul
             f"Elapsed time for {vectors_num} vectors and algorithm {name}: {time}s\n"
             f"Results: precision {prec}, recall {rec}, f1 {f1}, false positives {fp}\n"
             f"Chosen parameters: {params}")
+
+    return best_results
+
+
+def create_measured_embeddings(model, faces_path, save_path, batch_size=None):
+    embeddings_creator = ImageEmbeddingsCreator(faces_path)
+    embeddings_creator.create_embeddings(model, save_path, batch_size)
+
+    images_num = load_embeddings_header(save_path)["count"]
+
+    return images_num / embeddings_creator.EmbeddingsCreationTime
+
+
+# Creates float32 and int8 embeddings of every model and compares the best pairwise precision, recall and F1
+# of every clustering algorithm on them, along with the inference throughput
+def evaluate_quantization(models, faces_path, embeddings_dir, algorithms_params_dict, calibration_path=None,
+                          calibration_size=100, logger=None, batch_size=None, n_threads=1, models_cache=None):
+    if logger is None:
+        logger = get_default_logger("Quantization")
+
+    if calibration_path is None:
+        calibration_path = faces_path
+
+    if not os.path.exists(embeddings_dir):
+        os.mkdir(embeddings_dir)
+
+    backend_params = {"calibration_path": calibration_path, "calibration_size": calibration_size}
+
+    for model_constructor, kwargs in models:
+        model = construct_model(model_constructor, kwargs, models_cache)
+
+        float_path = f"{embeddings_dir}/{model.Name}"
+        float_throughput = create_measured_embeddings(model, faces_path, float_path, batch_size)
+
+        model.set_inference_backend("tflite-int8", models_cache, **backend_params)
+
+        int8_path = f"{embeddings_dir}/{model.Name}_int8"
+        int8_throughput = create_measured_embeddings(model, faces_path, int8_path, batch_size)
+
+        float_results = evaluate_clustering_algorithms(algorithms_params_dict, float_path, logger=logger,
+                                                       n_threads=n_threads)
+        int8_results = evaluate_clustering_algorithms(algorithms_params_dict, int8_path, logger=logger,
+                                                      n_threads=n_threads)
+
+        report = [f"Model {model.Name} float32 vs int8: {float_throughput:.1f} vs {int8_throughput:.1f} images/s, "
+                  f"speedup {int8_throughput / float_throughput:.2f}x"]
+
+        for name in algorithms_params_dict:
+            if name not in float_results or name not in int8_results:
+                continue
+
+            report.append(
+                f"{name}: precision {float_results[name]['precision']} vs {int8_results[name]['precision']}, "
+                f"recall {float_results[name]['recall']} vs {int8_results[name]['recall']}, "
+                f"f1 {float_results[name]['f1-measure']} vs {int8_results[name]['f1-measure']}")
+
+        logger.info("\n".join(report))
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from src.clustering.algorithms import algorithms
+from src.clustering.algorithms.algorithms import chinese_whispers, cluster_threshold
+from src.clustering.clustering_utils import find_euclidean_distance, find_cosine_similarity, find_taxicab_distance
+
+
+# The loop over clusters and their members which cluster_threshold replaced
+def reference_cluster_threshold(vectors, threshold, distance_func):
+    labels = []
+    clusters = {}
+    latest_cluster = 0
+
+    for vector in vectors:
+        added = False
+        for cluster in clusters.keys():
+            for labeled in clusters[cluster]:
+                if distance_func(vector, labeled) <= threshold:
+                    labels.append(cluster)
+                    clusters[cluster].append(vector)
+                    added = True
+                    break
+
+            if added:
+                break
+        else:
+            clusters.update({latest_cluster: [vector]})
+            labels.append(latest_cluster)
+            latest_cluster += 1
+
+    return labels
+
+
+# A custom distance function, which is called with the preceding vectors, an empty matrix for the first vector
+def find_chebyshev_distance(considered_representation, other_representations):
+    return np.max(np.abs(other_representations - considered_representation), axis=other_representations.ndim - 1)
+
+
+def create_vectors(seed, count=120):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=3, size=(12, 8))
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.normal(size=(count, 8))
+
+    # Duplicates are at distance zero from each other
+    vectors[rng.integers(0, count, 10)] = vectors[rng.integers(0, count, 10)]
+
+    return vectors.astype("float32")
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("distance_func, thresholds", [
+    (find_euclidean_distance, (0.5, 2.5, 4, 6)),
+    (find_cosine_similarity, (0.01, 0.05, 0.15, 0.3)),
+    (find_taxicab_distance, (2, 7, 10, 15)),
+    (find_chebyshev_distance, (0.5, 1.5, 2.5, 4))
+])
+def test_matches_reference(seed, distance_func, thresholds):
+    vectors = create_vectors(seed)
+
+    for threshold in thresholds:
+        expected = reference_cluster_threshold(vectors, threshold, distance_func)
+        labels = cluster_threshold(vectors, {"threshold": threshold, "distance": distance_func})
+
+        assert labels.tolist() == expected
+
+
+# Spans more than one block of preceding distances
+def test_matches_reference_over_blocks():
+    vectors = create_vectors(3, count=300)
+    expected = reference_cluster_threshold(vectors, 4, find_euclidean_distance)
+
+    assert cluster_threshold(vectors, {"threshold": 4, "distance": "euclidean"}).tolist() == expected
+
+
+def create_blobs(seed, blobs=5, count=40):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=50, size=(blobs, 8))
+    blob_labels = np.repeat(np.arange(blobs), count)
+
+    return (centers[blob_labels] + rng.normal(size=(len(blob_labels), 8))).astype("float32"), blob_labels
+
+
+def get_partition(labels):
+    labels = np.asarray(labels)
+
+    return sorted(sorted(np.flatnonzero(labels == label).tolist()) for label in np.unique(labels))
+
+
+@pytest.mark.parametrize("batch_size", [1, 16, 256])
+def test_chinese_whispers_separates_blobs(batch_size):
+    vectors, blob_labels = create_blobs(0)
+    labels = chinese_whispers(vectors, {"threshold": 10, "n_neighbors": 40, "batch_size": batch_size})
+
+    assert get_partition(labels) == get_partition(blob_labels)
+
+
+def test_chinese_whispers_is_reproducible():
+    vectors, _ = create_blobs(1, blobs=8, count=30)
+    vectors += np.random.default_rng(2).normal(scale=10, size=vectors.shape).astype("float32")
+
+    params = {"threshold": 30, "n_neighbors": 15, "batch_size": 32, "random_state": 7}
+    labels = chinese_whispers(vectors, params)
+
+    assert np.array_equal(chinese_whispers(vectors, params), labels)
+
+
+# Labels which never settle, as batch-synchronous updates may oscillate, still stop after the given iterations
+def test_chinese_whispers_iterations_cap(monkeypatch):
+    vectors, _ = create_blobs(3, blobs=2, count=10)
+    batches = list()
+
+    def propagate_labels(graph, labels, nodes):
+        batches.append(nodes)
+
+        return (labels[nodes] + 1) % len(labels)
+
+    monkeypatch.setattr(algorithms, "propagate_labels", propagate_labels)
+    chinese_whispers(vectors, {"threshold": 10, "n_neighbors": 5, "batch_size": 8, "iterations": 4})
+
+    assert len(batches) == 4 * 3
+    assert sorted(np.concatenate(batches[:3]).tolist()) == list(range(len(vectors)))
@@ -0,0 +1,169 @@
+from multiprocessing import Pool
+
+import numpy as np
+import pytest
+
+from src.clustering.algorithms import app_rank_order
+from src.clustering.algorithms.app_rank_order import aro_clustering, calculate_symmetric_dist, INFINITE
+from src.clustering.nearest_neighbors import find_nearest_neighbors
+
+THRESHOLDS = (1, 1.5, 2, 3)
+
+
+# The breadth first search over sets which aro_clustering replaced. It only follows the edges from a face to its
+# plausible neighbors, so its clusters depend on the order in which set.pop returns the faces.
+def reference_aro_clustering(app_nearest_neighbors, distance_matrix, threshold):
+    nodes = set(list(np.arange(0, distance_matrix.shape[0])))
+    plausible_neighbors = {i: set(list(app_nearest_neighbors[i, np.where(distance_matrix[i, :] <= threshold)][0]))
+                           for i in range(app_nearest_neighbors.shape[0])}
+    clusters = []
+
+    while nodes:
+        n = nodes.pop()
+        group = {n}
+        queue = [n]
+
+        while queue:
+            n = queue.pop(0)
+            neighbors = nodes.intersection(plausible_neighbors[n])
+            neighbors.difference_update(group)
+            nodes.difference_update(neighbors)
+            group.update(neighbors)
+            queue.extend(neighbors)
+
+        clusters.append(group)
+
+    labels = [0] * distance_matrix.shape[0]
+    for idx, cluster in enumerate(clusters):
+        for image_idx in cluster:
+            labels[image_idx] = idx
+
+    return np.array(labels)
+
+
+# The per row symmetric distance which calculate_symmetric_dist replaced
+def reference_symmetric_dist_row(nearest_neighbors, row_no):
+    dist_row = np.zeros(nearest_neighbors.shape[1])
+    f1 = nearest_neighbors[row_no]
+
+    for idx, neighbor in enumerate(f1[1:]):
+        Oi = idx + 1
+        co_neighbor = True
+
+        try:
+            row = nearest_neighbors[neighbor]
+            Oj = np.where(row == row_no)[0][0] + 1
+        except IndexError:
+            Oj = nearest_neighbors.shape[1] + 1
+            co_neighbor = False
+
+        dij = len(set(f1[0:Oi]).difference(set(nearest_neighbors[neighbor])))
+        dji = len(set(nearest_neighbors[neighbor][0:Oj]).difference(set(f1)))
+
+        if not co_neighbor:
+            dist_row[Oi] = INFINITE
+        else:
+            dist_row[Oi] = float(dij + dji) / min(Oi, Oj)
+
+    return dist_row
+
+
+def create_neighbors(seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(int(rng.integers(10, 60)), 4)).astype("float32")
+    app_nearest_neighbors, _ = find_nearest_neighbors(vectors, int(rng.integers(3, 8)), index="exact")
+
+    return app_nearest_neighbors
+
+
+def create_inputs(seed):
+    app_nearest_neighbors = create_neighbors(seed)
+
+    return app_nearest_neighbors, calculate_symmetric_dist(app_nearest_neighbors)
+
+
+def get_plausible_pairs(app_nearest_neighbors, distance_matrix, threshold):
+    faces, positions = np.nonzero(distance_matrix <= threshold)
+
+    return set(zip(faces.tolist(), app_nearest_neighbors[faces, positions].tolist()))
+
+
+def get_partition(labels):
+    return sorted(sorted(np.flatnonzero(labels == label).tolist()) for label in np.unique(labels))
+
+
+def calculate_in_pool(app_nearest_neighbors):
+    return calculate_symmetric_dist(app_nearest_neighbors, n_jobs=2)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_symmetric_dist_matches_reference(seed):
+    app_nearest_neighbors = create_neighbors(seed)
+    expected = np.stack([reference_symmetric_dist_row(app_nearest_neighbors, row_no)
+                         for row_no in range(len(app_nearest_neighbors))])
+
+    np.testing.assert_array_equal(calculate_symmetric_dist(app_nearest_neighbors), expected)
+
+
+def test_blocked_symmetric_dist_matches_reference(monkeypatch):
+    app_nearest_neighbors = create_neighbors(2)
+    expected = calculate_symmetric_dist(app_nearest_neighbors)
+
+    monkeypatch.setattr(app_rank_order, "SYMMETRIC_DIST_BLOCK_ELEMENTS", 7 * app_nearest_neighbors.shape[1] ** 2)
+    np.testing.assert_array_equal(calculate_symmetric_dist(app_nearest_neighbors), expected)
+
+
+@pytest.mark.parametrize("n_jobs", (2, 3))
+def test_parallel_symmetric_dist_matches_serial(n_jobs):
+    app_nearest_neighbors = create_neighbors(0)
+
+    np.testing.assert_array_equal(calculate_symmetric_dist(app_nearest_neighbors, n_jobs=n_jobs),
+                                  calculate_symmetric_dist(app_nearest_neighbors))
+
+
+# Clustering in the daemonic workers of the parameters grid search
+def test_parallel_symmetric_dist_in_daemonic_process():
+    app_nearest_neighbors = create_neighbors(1)
+
+    with Pool(processes=1) as p:
+        d = p.apply(calculate_in_pool, (app_nearest_neighbors,))
+
+    np.testing.assert_array_equal(d, calculate_symmetric_dist(app_nearest_neighbors))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_refines_to_reference(seed):
+    app_nearest_neighbors, distance_matrix = create_inputs(seed)
+
+    for threshold in THRESHOLDS:
+        expected = reference_aro_clustering(app_nearest_neighbors, distance_matrix, threshold)
+        labels = aro_clustering(app_nearest_neighbors, distance_matrix, threshold)
+
+        pairs = get_plausible_pairs(app_nearest_neighbors, distance_matrix, threshold)
+        one_directional = [(i, j) for i, j in pairs if (j, i) not in pairs]
+
+        # With every plausible pair plausible both ways the graphs agree, otherwise the new clusters
+        # are unions of the reference ones, merged by the one directional pairs
+        if not one_directional:
+            assert get_partition(labels) == get_partition(expected)
+
+        for label in np.unique(expected):
+            assert len(np.unique(labels[expected == label])) == 1
+
+        assert all(labels[i] == labels[j] for i, j in one_directional)
+
+
+def test_one_directional_pairs_are_merged():
+    for seed in range(200):
+        app_nearest_neighbors, distance_matrix = create_inputs(seed)
+
+        for threshold in THRESHOLDS:
+            pairs = get_plausible_pairs(app_nearest_neighbors, distance_matrix, threshold)
+            one_directional = [(i, j) for i, j in pairs if (j, i) not in pairs]
+
+            if one_directional:
+                labels = aro_clustering(app_nearest_neighbors, distance_matrix, threshold)
+                assert all(labels[i] == labels[j] for i, j in one_directional)
+                return
+
+    pytest.fail("No inputs with a one directional plausible pair")
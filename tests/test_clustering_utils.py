@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from src.clustering.clustering_utils import find_cosine_similarity, pairwise_distances, radius_neighbors_graph
+
+
+@pytest.mark.parametrize("distance", ["euclidean", "manhattan", find_cosine_similarity])
+def test_radius_neighbors_graph(distance):
+    vectors = np.random.default_rng(0).normal(size=(70, 6)).astype("float32")
+    vectors[10] = vectors[3]
+
+    dense = pairwise_distances(vectors, distance=distance)
+    radius = np.quantile(dense, 0.2)
+
+    graph = radius_neighbors_graph(vectors, radius, distance=distance, block_size=16)
+    rows, columns = np.nonzero(dense <= radius)
+
+    assert graph.nnz == len(rows)
+    np.testing.assert_array_equal(np.asarray(graph[rows, columns]).ravel(), dense[rows, columns])
+
+    # Zero distances of duplicates and of every vector to itself stay stored
+    assert 10 in graph.indices[graph.indptr[3]:graph.indptr[4]]
+    assert all(idx in graph.indices[graph.indptr[idx]:graph.indptr[idx + 1]] for idx in range(len(vectors)))
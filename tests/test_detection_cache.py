@@ -0,0 +1,119 @@
+import numpy as np
+
+from src.extraction.detection_cache import DetectionCache
+
+
+class Detector:
+    Name = "Test Detector"
+
+    @staticmethod
+    def get_detection_config():
+        return ""
+
+
+def mtcnn_face(x):
+    return {"box": (x, x + 1, 10, 12), "confidence": 0.5,
+            "keypoints": {"left_eye": (x, 1), "right_eye": (x + 2, 1), "nose": (x + 1, 3),
+                          "mouth_left": (x, 5), "mouth_right": (x + 2, 5)}}
+
+
+def dlib_face(x, landmarks=True):
+    face = {"box": (x, 0, 8, 8), "keypoints": {"left_eye": np.array([x, 2]), "right_eye": np.array([x + 3, 2]),
+                                               "nose": np.array([x + 1, 4])}}
+    if landmarks:
+        face["landmarks"] = np.arange(136, dtype="float32").reshape(68, 2) + x
+        face["landmarks_predictor"] = "./models/shape_predictor_68_face_landmarks.dat"
+
+    return face
+
+
+def create_images(tmp_path, count):
+    paths = list()
+
+    for idx in range(count):
+        path = tmp_path / f"image_{idx}.jpg"
+        path.write_bytes(f"image {idx}".encode())
+        paths.append(str(path))
+
+    return paths
+
+
+def assert_faces_equal(actual, expected):
+    assert len(actual) == len(expected)
+
+    for actual_face, expected_face in zip(actual, expected):
+        assert actual_face["box"] == tuple(expected_face["box"])
+        assert actual_face.get("confidence") == expected_face.get("confidence")
+        assert {name: tuple(point) for name, point in actual_face["keypoints"].items()} == \
+               {name: tuple(point) for name, point in expected_face["keypoints"].items()}
+        assert ("landmarks" in actual_face) == ("landmarks" in expected_face)
+
+        if "landmarks" in expected_face:
+            np.testing.assert_array_equal(actual_face["landmarks"], expected_face["landmarks"])
+            assert actual_face["landmarks_predictor"] == expected_face["landmarks_predictor"]
+
+
+def roundtrip(tmp_path, detections, flush_interval=2):
+    images = create_images(tmp_path, len(detections))
+
+    with DetectionCache(str(tmp_path / "cache"), flush_interval=flush_interval) as cache:
+        for image_path, faces in zip(images, detections):
+            assert cache.lookup(Detector(), image_path) is None
+            cache.store(Detector(), image_path, faces)
+
+    cache = DetectionCache(str(tmp_path / "cache"))
+    for image_path, faces in zip(images, detections):
+        assert_faces_equal(cache.lookup(Detector(), image_path), faces)
+
+    assert cache.Misses == 0
+
+
+def test_faces_without_landmarks(tmp_path):
+    roundtrip(tmp_path, [[mtcnn_face(1)], [mtcnn_face(2), mtcnn_face(3)], [mtcnn_face(4)]])
+
+
+def test_faces_with_landmarks(tmp_path):
+    roundtrip(tmp_path, [[dlib_face(1)], [dlib_face(2, landmarks=False), dlib_face(3)], [dlib_face(4)]])
+
+
+def test_images_without_faces(tmp_path):
+    roundtrip(tmp_path, [[], [], [dlib_face(1)], [], [dlib_face(2, landmarks=False)], []])
+
+
+def test_only_images_without_faces(tmp_path):
+    roundtrip(tmp_path, [[], [], []])
+
+
+def test_flushes_append_segments(tmp_path):
+    detections = [[dlib_face(idx, landmarks=idx % 2 == 0)] * (idx % 3) for idx in range(10)]
+    roundtrip(tmp_path, detections, flush_interval=2)
+
+    table_path = next((tmp_path / "cache").iterdir())
+    segments = sorted(table_path.iterdir())
+    assert len(segments) == 5
+
+    for segment_path in segments:
+        with np.load(segment_path) as segment:
+            assert len(segment["image_hashes"]) == 2
+
+
+def test_compaction_merges_segments(tmp_path):
+    detections = [[mtcnn_face(idx)] * (idx % 3) for idx in range(40)]
+    images = create_images(tmp_path, len(detections))
+
+    with DetectionCache(str(tmp_path / "cache"), flush_interval=2) as cache:
+        for image_path, faces in zip(images, detections):
+            cache.store(Detector(), image_path, faces)
+
+    table_path = next((tmp_path / "cache").iterdir())
+    assert len(list(table_path.iterdir())) == 20
+
+    cache = DetectionCache(str(tmp_path / "cache"))
+    for image_path, faces in zip(images, detections):
+        assert_faces_equal(cache.lookup(Detector(), image_path), faces)
+
+    assert len(list(table_path.iterdir())) == 1
+
+    cache = DetectionCache(str(tmp_path / "cache"))
+    for image_path, faces in zip(images, detections):
+        assert_faces_equal(cache.lookup(Detector(), image_path), faces)
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from src.embedding.embeddings_store import EmbeddingsStoreWriter, is_embeddings_store, load_embeddings_store, \
+    save_embeddings_store
+
+
+def write_interrupted(store_path, paths, vectors, interrupt_at, chunk_size=100):
+    with pytest.raises(KeyboardInterrupt):
+        with EmbeddingsStoreWriter(store_path, "model", chunk_size=chunk_size) as writer:
+            for start in range(0, len(paths), 50):
+                if start == interrupt_at:
+                    raise KeyboardInterrupt()
+
+                writer.write_batch(paths[start:start + 50], vectors[start:start + 50])
+
+
+def create_embeddings(count, dimension=8):
+    paths = [f"image_{idx}.jpg" for idx in range(count)]
+    vectors = np.random.default_rng(0).normal(size=(count, dimension)).astype("float32")
+
+    return paths, vectors
+
+
+def test_interrupted_store_is_incomplete(tmp_path):
+    store_path = str(tmp_path / "store")
+    paths, vectors = create_embeddings(2500)
+
+    write_interrupted(store_path, paths, vectors, interrupt_at=1500)
+
+    assert not is_embeddings_store(store_path)
+    with pytest.raises(FileNotFoundError):
+        load_embeddings_store(store_path)
+
+
+def test_interrupted_store_resumes(tmp_path):
+    store_path = str(tmp_path / "store")
+    paths, vectors = create_embeddings(2500)
+
+    write_interrupted(store_path, paths, vectors, interrupt_at=1550)
+
+    with EmbeddingsStoreWriter(store_path, "model", chunk_size=100, resume=True) as writer:
+        completed = len(writer.CompletedPaths)
+        assert writer.CompletedPaths == paths[:completed]
+
+        writer.write_batch(paths[completed:], vectors[completed:])
+
+    loaded_paths, loaded_vectors, header = load_embeddings_store(store_path, verify=True)
+    assert loaded_paths == paths
+    np.testing.assert_array_equal(loaded_vectors, vectors)
+
+
+def test_rewritten_store_is_incomplete_until_closed(tmp_path):
+    store_path = str(tmp_path / "store")
+    paths, vectors = create_embeddings(500)
+
+    save_embeddings_store(store_path, paths, vectors, "model")
+    assert is_embeddings_store(store_path)
+
+    write_interrupted(store_path, paths, vectors, interrupt_at=250)
+    assert not is_embeddings_store(store_path)
+
+
+# A rewrite hard-killed before its first chunk flush, where the writer is never closed
+def test_killed_rewrite_resumes_from_empty_checkpoint(tmp_path):
+    store_path = str(tmp_path / "store")
+    paths, vectors = create_embeddings(500)
+
+    write_interrupted(store_path, paths, vectors, interrupt_at=250)
+
+    script = f"""
+import os
+import numpy as np
+from src.embedding.embeddings_store import EmbeddingsStoreWriter
+
+writer = EmbeddingsStoreWriter({store_path!r}, "model", chunk_size=100)
+writer.write_batch(["image.jpg"] * 50, np.zeros((50, 8), dtype="float32"))
+os._exit(0)
+"""
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    with EmbeddingsStoreWriter(store_path, "model", chunk_size=100, resume=True) as writer:
+        assert writer.CompletedPaths == list()
+        writer.write_batch(paths, vectors)
+
+    loaded_paths, loaded_vectors, header = load_embeddings_store(store_path, verify=True)
+    assert loaded_paths == paths
+    np.testing.assert_array_equal(loaded_vectors, vectors)
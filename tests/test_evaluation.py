@@ -0,0 +1,38 @@
+import numpy as np
+
+from src.test_system import evaluation
+from src.test_system.evaluation import evaluate_inference_backend
+
+
+class Model:
+    Name = "Model"
+    BatchSize = 4
+
+    def __init__(self, offset):
+        self.Offset = offset
+
+    def predict(self, x, batch_size=32):
+        return x + self.Offset
+
+
+class EmbeddingModel:
+    Name = "Model"
+    BatchSize = 4
+
+    def __init__(self):
+        self.Model = Model(0)
+
+    def set_inference_backend(self, backend, models_cache=None, offset=0):
+        self.Model = Model(offset)
+
+
+def test_inference_backend_report(monkeypatch):
+    monkeypatch.setattr(evaluation, "construct_model", lambda *args: EmbeddingModel())
+    monkeypatch.setattr(evaluation, "load_images_sample", lambda faces_path, model, sample_size:
+                        np.ones((sample_size, 3), dtype="float32"))
+
+    results = evaluate_inference_backend([(EmbeddingModel, dict())], "faces", "backend", {"offset": 0.5},
+                                         sample_size=8)
+
+    assert results["Model"]["max_difference"] == 0.5
+    assert results["Model"]["speedup"] > 0
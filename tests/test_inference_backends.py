@@ -0,0 +1,69 @@
+from src.embedding import inference_backends
+from src.embedding.embeddings_cache import EmbeddingsCache
+from src.embedding.embeddings_creation import AbstractEmbeddingModel
+from src.embedding.inference_backends import hash_calibration_sample, load_graph_endpoints, save_graph_endpoints
+
+
+def create_sample(path, contents):
+    path.mkdir()
+
+    for idx, content in enumerate(contents):
+        (path / f"face_{idx}.jpg").write_bytes(content)
+
+    return str(path)
+
+
+def test_calibration_sample_hash(tmp_path):
+    first = create_sample(tmp_path / "first", [b"a", b"b", b"c"])
+    copy = create_sample(tmp_path / "copy", [b"a", b"b", b"c"])
+    other = create_sample(tmp_path / "other", [b"a", b"b", b"d"])
+
+    assert hash_calibration_sample(first, 3) == hash_calibration_sample(copy, 3)
+    assert hash_calibration_sample(first, 3) != hash_calibration_sample(other, 3)
+    assert hash_calibration_sample(first, 3) != hash_calibration_sample(first, 2)
+
+
+class NormalizedModel(AbstractEmbeddingModel):
+    Name = "Normalized"
+    NormalizedOutput = True
+
+
+def test_quantized_outputs_are_not_normalized(monkeypatch, tmp_path):
+    monkeypatch.setattr(inference_backends, "create_inference_model", lambda *args, **kwargs: None)
+    sample = create_sample(tmp_path / "sample", [b"a", b"b"])
+
+    model = NormalizedModel()
+    model.set_inference_backend("frozen-graph")
+    assert model.NormalizedOutput
+
+    model.set_inference_backend("tflite-int8", calibration_path=sample, calibration_size=2)
+    assert not model.NormalizedOutput
+
+
+def test_embeddings_cache_keys_int8_models_by_calibration_sample(monkeypatch, tmp_path):
+    monkeypatch.setattr(inference_backends, "create_inference_model", lambda *args, **kwargs: None)
+    first = create_sample(tmp_path / "first", [b"a", b"b", b"c"])
+    copy = create_sample(tmp_path / "copy", [b"a", b"b", b"c"])
+    other = create_sample(tmp_path / "other", [b"a", b"b", b"d"])
+
+    def get_model_key(backend, **backend_params):
+        model = NormalizedModel()
+        model.set_inference_backend(backend, **backend_params)
+
+        return cache.get_model_key(model)
+
+    with EmbeddingsCache(str(tmp_path / "cache.sqlite")) as cache:
+        key = get_model_key("tflite-int8", calibration_path=first, calibration_size=3)
+
+        assert key == get_model_key("tflite-int8", calibration_path=copy, calibration_size=3, num_threads=4)
+        assert key != get_model_key("tflite-int8", calibration_path=other, calibration_size=3)
+        assert key != get_model_key("tflite-int8", calibration_path=first, calibration_size=2)
+        assert key != get_model_key("frozen-graph")
+        assert get_model_key("frozen-graph") == get_model_key("frozen-graph", intra_op_threads=2)
+
+
+def test_graph_endpoints(tmp_path):
+    endpoints_path = str(tmp_path / "model.pb.json")
+    save_graph_endpoints(endpoints_path, "input_1", "embeddings/l2_normalize")
+
+    assert load_graph_endpoints(endpoints_path) == ("input_1", "embeddings/l2_normalize")
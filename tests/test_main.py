@@ -0,0 +1,62 @@
+import numpy as np
+
+from src.main import main, parse_params, parse_params_range
+
+
+def test_parse_params():
+    assert parse_params(["threshold=0.5", "distance=cosine", "k_neighbors=4"]) == \
+           {"threshold": 0.5, "distance": "cosine", "k_neighbors": 4}
+
+
+def test_integer_range():
+    params_range = parse_params_range(["k_neighbors=4:8:2"])
+
+    assert list(params_range["k_neighbors"]) == [4, 6]
+    assert all(type(value) is int for value in params_range["k_neighbors"])
+
+
+def test_float_range():
+    params_range = parse_params_range(["threshold=0.5:1:0.25", "eps=1:2:0.5"])
+
+    np.testing.assert_allclose(params_range["threshold"], [0.5, 0.75])
+    np.testing.assert_allclose(params_range["eps"], [1, 1.5])
+
+
+def test_values_list():
+    assert parse_params_range(["distance=euclidean,cosine", "n_neighbors=10,20"]) == \
+           {"distance": ["euclidean", "cosine"], "n_neighbors": [10, 20]}
+
+
+def test_quantize_report(monkeypatch):
+    from src import main as main_module
+    from src.test_system import evaluation
+
+    calls = list()
+    monkeypatch.setattr(main_module, "resolve_model", lambda name: (name, dict()))
+    monkeypatch.setattr(evaluation, "evaluate_quantization", lambda *args, **kwargs: calls.append((args, kwargs)))
+
+    main(["quantize-report", "faces", "embeddings", "--model", "facenet", "--weights", "facenet=weights.h5",
+          "--calibration-path", "calibration", "--algorithm", "rank-order", "--param", "k_neighbors=4:8:2"])
+
+    (models, faces_path, embeddings_dir, algorithms), kwargs = calls[0]
+    assert [kwargs["weights_path"] for _, kwargs in models] == ["weights.h5"]
+    assert (faces_path, embeddings_dir) == ("faces", "embeddings")
+    assert list(algorithms["rank-order"][1]["k_neighbors"]) == [4, 6]
+    assert kwargs["calibration_path"] == "calibration" and kwargs["calibration_size"] == 100
+
+
+def test_compare_backend(monkeypatch):
+    from src import main as main_module
+    from src.test_system import evaluation
+
+    calls = list()
+    monkeypatch.setattr(main_module, "resolve_model", lambda name: (name, dict()))
+    monkeypatch.setattr(evaluation, "evaluate_inference_backend", lambda *args, **kwargs: calls.append((args, kwargs)))
+
+    main(["embed", "faces", "embeddings", "--model", "facenet", "--backend", "facenet=frozen-graph",
+          "--intra-op-threads", "2", "--compare-backend", "--sample-size", "64"])
+
+    (models, faces_path, backend, backend_params), kwargs = calls[0]
+    assert models == [("facenet", dict())]
+    assert backend == "frozen-graph" and backend_params["intra_op_threads"] == 2
+    assert kwargs["sample_size"] == 64
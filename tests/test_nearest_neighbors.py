@@ -0,0 +1,63 @@
+import sys
+
+import numpy as np
+import pytest
+
+from src.clustering.algorithms.rank_order import build_index
+from src.clustering.nearest_neighbors import find_nearest_neighbors
+
+
+def create_vectors(seed=0, count=50, dimension=8):
+    return np.random.default_rng(seed).normal(size=(count, dimension)).astype("float32")
+
+
+def squared_distances(vectors):
+    return np.sum((vectors[:, None, :] - vectors[None, :, :]) ** 2, axis=2)
+
+
+@pytest.mark.parametrize("squared", [False, True])
+def test_exact_euclidean_distances(squared):
+    vectors = create_vectors()
+    expected = squared_distances(vectors) if squared else np.sqrt(squared_distances(vectors))
+
+    neighbors, dists = find_nearest_neighbors(vectors, 10, index="exact", squared=squared)
+
+    np.testing.assert_allclose(dists, np.take_along_axis(expected, neighbors, axis=1), rtol=1e-4, atol=1e-4)
+    np.testing.assert_array_equal(neighbors[:, 0], np.arange(len(vectors)))
+
+
+# Rank-Order thresholds were tuned on the squared euclidean distances of FLANN
+def test_rank_order_uses_squared_distances():
+    vectors = create_vectors(1)
+    expected = squared_distances(vectors)
+
+    neighbors, dists = build_index(vectors, distance="euclidean")
+
+    assert neighbors.shape == (len(vectors), len(vectors))
+    np.testing.assert_allclose(dists, np.take_along_axis(expected, neighbors, axis=1), rtol=1e-4, atol=1e-4)
+
+
+class FakeFLANN:
+    Vectors = None
+
+    def build_index(self, vectors, **params):
+        FakeFLANN.Vectors = vectors
+        return {"checks": 32}
+
+    def nn_index(self, vectors, n_neighbors, checks):
+        assert vectors.dtype in (np.float32, np.float64)
+        dists = np.sum((vectors[:, None, :] - vectors[None, :, :]) ** 2, axis=2)
+        neighbors = np.argsort(dists, axis=1, kind="stable")[:, :n_neighbors]
+
+        return neighbors, np.take_along_axis(dists, neighbors, axis=1)
+
+
+def test_flann_indexes_float16_as_float32(monkeypatch):
+    fake_pyflann = type("pyflann", (), {"FLANN": FakeFLANN, "set_distance_type": staticmethod(lambda **_: None)})
+    monkeypatch.setitem(sys.modules, "pyflann", fake_pyflann)
+
+    vectors = create_vectors().astype("float16")
+    neighbors, dists = find_nearest_neighbors(vectors, 5, index="flann")
+
+    assert FakeFLANN.Vectors.dtype == np.float32
+    assert neighbors.shape == dists.shape == (len(vectors), 5)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from src.clustering.algorithms import rank_order
+from src.clustering.algorithms.rank_order import cluster_rank_order, NEIGHBORS_PER_K
+
+
+def create_blobs(seed=0, clusters=6, size=30, dimension=8):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=20, size=(clusters, dimension))
+    vectors = np.concatenate([center + rng.normal(size=(size, dimension)) for center in centers])
+
+    return vectors.astype("float32")
+
+
+def record_neighbors(monkeypatch):
+    requested = list()
+    find_nearest_neighbors = rank_order.find_nearest_neighbors
+
+    def find_neighbors(vectors, n_neighbors, **kwargs):
+        requested.append(n_neighbors)
+        return find_nearest_neighbors(vectors, n_neighbors, **kwargs)
+
+    monkeypatch.setattr(rank_order, "find_nearest_neighbors", find_neighbors)
+
+    return requested
+
+
+def get_partition(labels):
+    labels = np.asarray(labels)
+    return sorted(sorted(np.flatnonzero(labels == label).tolist()) for label in np.unique(labels))
+
+
+def test_default_neighbor_lists_are_bounded(monkeypatch):
+    vectors = create_blobs()
+    requested = record_neighbors(monkeypatch)
+
+    cluster_rank_order(vectors, {"distance": "euclidean", "k_neighbors": 5, "threshold": 15})
+    cluster_rank_order(vectors, {"distance": "euclidean", "k_neighbors": 5, "threshold": 15, "n_neighbors": None})
+
+    assert requested == [NEIGHBORS_PER_K * 5, len(vectors)]
+
+
+def test_bounded_lists_match_full_lists():
+    vectors = create_blobs(1)
+
+    for threshold in (5, 15, 30):
+        params = {"distance": "euclidean", "k_neighbors": 5, "threshold": threshold}
+
+        bounded = cluster_rank_order(vectors, params)
+        full = cluster_rank_order(vectors, dict(params, n_neighbors=None))
+
+        assert get_partition(bounded) == get_partition(full)